@@ -1,4 +1,5 @@
 from bio_autorun.executors.base import BaseExecutorConfig, ExecutorFactory
+from bio_autorun.executors.aio import AsyncLocalExecutorConfig
 from bio_autorun.executors.cat import CatExecutorConfig
 from bio_autorun.executors.dummy import DummyExecutorConfig
 from bio_autorun.executors.local import LocalExecutorConfig
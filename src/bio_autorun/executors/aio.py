@@ -0,0 +1,154 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+import logging
+import os
+import subprocess
+import threading
+from typing_extensions import Optional, override
+
+from bio_autorun.executors.base import BaseExecutor, BaseExecutorConfig, ExecutorFactory
+from bio_autorun.executors.local import LocalJob
+from bio_autorun.job import Job, JobStatus, ResourceUsage
+from bio_autorun.process import JobStreams, wait_with_usage
+
+logger = logging.getLogger(__name__)
+
+
+async def _wait(proc: subprocess.Popen) -> ResourceUsage:
+    """
+    Wait for a process from the running loop, through a pidfd registered on it, then reap it with
+    ``wait_with_usage``. Where pidfds are not available, the wait blocks a thread of the default executor.
+
+    Unlike asyncio subprocesses, this does not need a child watcher, which is shared by the whole
+    process on Python < 3.12 and whose API is deprecated since.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        # not on Linux, or a kernel older than 5.3 (ENOSYS)
+        return await loop.run_in_executor(None, wait_with_usage, proc)
+    exited = loop.create_future()
+
+    def on_exit():
+        loop.remove_reader(pidfd)
+        exited.set_result(None)
+
+    loop.add_reader(pidfd, on_exit)
+    try:
+        await exited
+    finally:
+        if not exited.done():
+            loop.remove_reader(pidfd)
+        os.close(pidfd)
+    # the process has exited, this does not block
+    return wait_with_usage(proc)
+
+
+class AsyncLocalExecutorConfig(BaseExecutorConfig):
+    def __init__(self, *, max_workers: int, max_inflight: Optional[int] = None, **kwargs):
+        """
+        :param max_workers: maximum number of jobs running at once
+        :param max_inflight: maximum number of queued and running jobs; submit blocks beyond it
+            (default: 8 times max_workers)
+        """
+        super().__init__(**kwargs)
+        self.max_workers = max_workers
+        self.max_inflight = max_inflight or 8 * max_workers
+
+
+class AsyncLocalExecutor(BaseExecutor):
+    """
+    Run jobs on the local machine from a single asyncio event loop.
+
+    Unlike LocalExecutor, a running job does not hold an OS thread: all processes are supervised by
+    one loop thread, and nothing is kept around once a job has finished.
+
+    The standard streams follow the job's stdin/stdout/stderr/stdin_str, see ``JobStreams``.
+    """
+
+    config: AsyncLocalExecutorConfig
+
+    def __init__(self, config: AsyncLocalExecutorConfig):
+        super().__init__(config)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._pending: deque[LocalJob] = deque()
+        self._tasks: set[asyncio.Task] = set()
+        self._idle: Optional[asyncio.Event] = None
+        self._inflight = threading.BoundedSemaphore(config.max_inflight)
+
+    @override
+    def enter_loop(self):
+        super().enter_loop()
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="async-local", daemon=True)
+        self._loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    @override
+    def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
+        asyncio.run_coroutine_threadsafe(self._idle.wait(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+        return super().exit_loop(exc_type, exc_value, traceback)
+
+    async def _setup(self):
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _enqueue(self, job: LocalJob):
+        self._idle.clear()
+        self._pending.append(job)
+        self._start_pending()
+
+    def _start_pending(self):
+        while self._pending and len(self._tasks) < self.config.max_workers:
+            task = self._loop.create_task(self._run_job(self._pending.popleft()))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._inflight.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(task.exception())
+        self._start_pending()
+        if not self._tasks and not self._pending:
+            self._idle.set()
+
+    async def _run_job(self, job: LocalJob):
+        with JobStreams(job) as streams:
+            proc = subprocess.Popen(job.cmd, cwd=job.cwd, env=job.env, shell=job.shell, **streams.popen_kwargs)
+            job.pid = proc.pid
+            job.start_time = datetime.now(timezone.utc)
+            job.status = JobStatus.STARTED
+            self.event_publish(JobStatus.STARTED, job)
+            streams.attach(proc)
+
+            # wait for the job to finish
+            job.usage = await _wait(proc)
+
+        job.end_time = datetime.now(timezone.utc)
+        job.status = JobStatus.COMPLETED
+        job.exit_code = proc.returncode
+        self.event_publish(JobStatus.COMPLETED, job)
+
+    def submit(self, job: Job):
+        # block the producer while too many jobs are in flight
+        self._inflight.acquire()
+        job = job.copy(LocalJob)
+        job.submitted_time = datetime.now(timezone.utc)
+        job.status = JobStatus.SUBMITTED
+        self.event_publish(JobStatus.SUBMITTED, job)
+
+        job.queued_time = datetime.now(timezone.utc)
+        job.status = JobStatus.QUEUED
+        self.event_publish(JobStatus.QUEUED, job)
+
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+
+
+ExecutorFactory.register(AsyncLocalExecutorConfig, AsyncLocalExecutor)
@@ -1,29 +1,43 @@
-import multiprocessing as mp
 from contextlib import contextmanager
+from typing import Iterable, Optional
 
+from bio_autorun.executors.events import EventBus, create_event_bus
 from bio_autorun.job import Job, JobStatus
+from bio_autorun.journal import JobJournal
 
 
 class BaseExecutorConfig:
-    pass
+    def __init__(self, *, event_bus: str = "thread", event_batch_size: int = 256, journal_path: Optional[str] = None):
+        """
+        :param event_bus: how job events are dispatched: "thread", "asyncio" or "process"
+        :param event_batch_size: maximum number of events delivered per dispatcher wake-up
+        :param journal_path: SQLite file recording every job transition, used to resume after a crash
+        """
+        self.event_bus = event_bus
+        self.event_batch_size = event_batch_size
+        self.journal_path = journal_path
 
 
 class BaseExecutor:
     def __init__(self, config: BaseExecutorConfig):
         self.config = config
-        self._event_queue = mp.JoinableQueue()
-        self._event_subscriptions = []
-        self._event_loop_worker = mp.Process(target=self._event_loop, daemon=True)
+        self._event_bus: EventBus = create_event_bus(config.event_bus, batch_size=config.event_batch_size)
+        self.journal: Optional[JobJournal] = JobJournal(config.journal_path) if config.journal_path else None
+        self._completed: Optional[set[str]] = None
 
     def enter_loop(self):
-        self._event_loop_worker.start()
+        if self.journal is not None:
+            self.journal.open()
+        self._event_bus.start()
 
     def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
-        self._event_queue.close()
-        self._event_queue.join()
-        self._event_loop_worker.terminate()
-        self._event_loop_worker.join()
+        self._event_bus.stop()
+        if self.journal is not None:
+            self.journal.close()
         if exc_type is not None:
+            # re-raise the original exception, so that e.g. sys.exit(0) keeps its exit code
+            if isinstance(exc_value, BaseException):
+                raise exc_value.with_traceback(traceback)
             raise exc_type(exc_value).with_traceback(traceback)
 
     @contextmanager
@@ -35,37 +49,49 @@ class BaseExecutor:
         self.enter_loop()
         try:
             yield
-        except Exception as e:
+        except BaseException as e:
+            # also clean up on KeyboardInterrupt, so that executors can stop their jobs
             return self.exit_loop(exc_type=type(e), exc_value=e, traceback=e.__traceback__)
         else:
             return self.exit_loop()
 
     def event_subscribe(self, status: JobStatus, callback):
         """
-        Subscribe to a job event. All callbacks will be executed in a separate process.
+        Subscribe to a job event. Callbacks are executed by the configured event bus, off the
+        submitting thread; with the "process" bus they must be picklable.
         :param status:
         :param callback:
         :return:
         """
-        self._event_subscriptions.append((status, callback))
+        self._event_bus.subscribe(status, callback)
 
     def event_publish(self, status: JobStatus, job: Job):
-        self._event_queue.put((status, job))
-
-    def _event_loop(self):
-        while True:
-            try:
-                status, job = self._event_queue.get()
-            except:
-                break
-            for s, callback in self._event_subscriptions:
-                if s == status:
-                    callback(job)
-            self._event_queue.task_done()
+        if self.journal is not None:
+            self.journal.record(status, job)
+        self._event_bus.publish(status, job)
+
+    def is_completed(self, name: str) -> bool:
+        """
+        Whether the journal records a successful run of the job, in which case it does not need to be submitted again.
+        Always False when the journal is disabled.
+        """
+        if self.journal is None:
+            return False
+        if self._completed is None:
+            self._completed = self.journal.completed_jobs()
+        return name in self._completed
 
     def submit(self, job: Job):
         raise NotImplementedError
 
+    def submit_many(self, jobs: Iterable[Job]):
+        """
+        Submit jobs from an iterable, consuming it lazily. Executors bounding the number of jobs in flight
+        block here until there is room, so the iterable may be an arbitrarily long generator.
+        """
+        for job in jobs:
+            self.submit(job)
+
 
 class ExecutorFactory:
     registry: dict[type, type] = {}
@@ -1,77 +1,390 @@
 import concurrent.futures
 from concurrent.futures.thread import ThreadPoolExecutor
+from collections import deque
 from datetime import datetime, timezone
+import heapq
+import itertools
 import logging
+import math
+import os
+import resource
+import signal
 import subprocess
-from typing_extensions import Optional, override
+import threading
+import time
+from typing_extensions import Callable, Optional, Union, override
 
 from bio_autorun.executors.base import BaseExecutor, BaseExecutorConfig, ExecutorFactory
 from bio_autorun.job import Job, JobStatus
+from bio_autorun.process import JobStreams, wait_with_usage
 
 logger = logging.getLogger(__name__)
 
 
+def _total_memory() -> int:
+    """
+    Physical memory of this node in MiB.
+    """
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+class _Watchdog:
+    """
+    Run callbacks at given monotonic times from a single thread.
+    """
+
+    def __init__(self):
+        self._timers: list[tuple[float, int, Callable, tuple]] = []
+        self._counter = itertools.count()
+        self._changed = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="local-watchdog", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+        self._thread.join()
+
+    def schedule(self, delay: float, callback: Callable, *args):
+        with self._changed:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._counter), callback, args))
+            self._changed.notify()
+
+    def _run(self):
+        while True:
+            due = []
+            with self._changed:
+                while not self._stopped and not due:
+                    now = time.monotonic()
+                    while self._timers and self._timers[0][0] <= now:
+                        due.append(heapq.heappop(self._timers))
+                    if not due:
+                        self._changed.wait(self._timers[0][0] - now if self._timers else None)
+                if self._stopped:
+                    return
+            for _, _, callback, args in due:
+                try:
+                    callback(*args)
+                except Exception:
+                    logger.exception("Error in watchdog callback")
+
+
+def _decode(tail: Optional[bytes]) -> str:
+    return "" if tail is None else tail.decode("utf-8", errors="replace")
+
+
 class LocalJob(Job):
+    __slots__ = ("pid", "cancelled", "stdout_tail", "stderr_tail")
+
     def __init__(self, *, pid: Optional[int] = None, **kwargs):
         super().__init__(**kwargs)
         self.pid = pid
+        self.cancelled = False
+        self.stdout_tail: Optional[bytes] = None
+        self.stderr_tail: Optional[bytes] = None
 
 
 class LocalExecutorConfig(BaseExecutorConfig):
-    def __init__(self, *, max_workers: int, **kwargs):
+    def __init__(self, *, max_workers: Optional[int] = None, cores: Optional[int] = None,
+                 memory: Optional[int] = None, thread_flag: Optional[str] = None,
+                 backfill_window: int = 64, max_backfill: int = 1000, max_inflight: Optional[int] = None,
+                 time_limit: Optional[float] = None, cpu_time_limit: Optional[float] = None,
+                 kill_grace: float = 30, tail_size: int = 0, **kwargs):
+        """
+        :param max_workers: maximum number of jobs running at once (default: number of cores)
+        :param cores: CPU cores available to jobs (default: all cores of the node)
+        :param memory: memory in MiB available to jobs (default: physical memory of the node)
+        :param thread_flag: command line flag receiving the number of cores of a job (e.g. "-nt" for IQ-TREE),
+            appended to commands that do not already set it
+        :param backfill_window: how many queued jobs behind a blocked one are considered for backfilling
+        :param max_backfill: how many jobs may overtake a blocked job before backfilling pauses
+        :param max_inflight: maximum number of queued and running jobs; submit blocks beyond it
+            (default: 8 times max_workers)
+        :param time_limit: default wall-clock limit in seconds for jobs that do not set one
+        :param cpu_time_limit: default CPU time limit in seconds for jobs that do not set one
+        :param kill_grace: seconds between SIGTERM and SIGKILL when a job is stopped
+        :param tail_size: number of trailing bytes of stdout and stderr to keep on each finished job
+            (``stdout_tail`` and ``stderr_tail``), and to log when it fails; 0 disables it
+        """
         super().__init__(**kwargs)
-        self.max_workers = max_workers
+        self.cores = cores or os.cpu_count()
+        self.memory = memory or _total_memory()
+        self.max_workers = max_workers or self.cores
+        self.thread_flag = thread_flag
+        self.backfill_window = backfill_window
+        self.max_backfill = max_backfill
+        self.max_inflight = max_inflight or 8 * self.max_workers
+        self.time_limit = time_limit
+        self.cpu_time_limit = cpu_time_limit
+        self.kill_grace = kill_grace
+        self.tail_size = tail_size
 
 
 class LocalExecutor(BaseExecutor):
+    """
+    Run jobs on the local machine, admitting them against the cores and memory they declare.
+
+    Jobs start in submission order. When the oldest queued job does not fit, smaller jobs behind it
+    are backfilled into the free resources, until ``max_backfill`` jobs have overtaken it; then the
+    executor waits for enough resources to be released for it.
+
+    Every job runs in its own process group. A job exceeding its wall-clock limit, or cancelled with
+    ``cancel``, gets SIGTERM and then SIGKILL after ``kill_grace`` seconds, and ends with the CANCELLED status.
+    The CPU time limit is enforced by the kernel (RLIMIT_CPU, SIGXCPU then SIGKILL after the same grace
+    period); such jobs complete with the signal as their exit code. The limit is set with prlimit on the
+    job's process right after it is spawned, rather than in a pre-exec hook which is unsafe from the
+    worker threads; it is inherited by every process the command starts afterwards, each of which gets
+    the full limit, but not by those it may have started in the meantime.
+    If an exception leaves ``acquire()``, queued jobs are cancelled and running ones are stopped.
+
+    The standard streams follow the job's stdin/stdout/stderr/stdin_str, see ``JobStreams``.
+    """
+
+    config: LocalExecutorConfig
+
     def __init__(self, config: LocalExecutorConfig):
         super().__init__(config)
         self._pool = ThreadPoolExecutor(max_workers=config.max_workers)
-        self._futures = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending: deque[LocalJob] = deque()
+        self._running = 0
+        self._free_cores = config.cores
+        self._free_memory = config.memory
+        self._overtaken = 0
+        self._active: dict[int, LocalJob] = {}  # running jobs by id(), names may repeat
+        self._watchdog: Optional[_Watchdog] = None
 
     @override
     def enter_loop(self):
         super().enter_loop()
+        self._watchdog = _Watchdog()
+        self._watchdog.start()
         self._pool.__enter__()
 
     @override
     def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
-        done_tasks, not_done_tasks = concurrent.futures.wait(
-            self._futures, return_when=concurrent.futures.FIRST_EXCEPTION
-        )
-        for task in done_tasks:
-            err = task.exception()
-            if err is not None:
-                logger.error(err)
+        if exc_type is not None:
+            self.cancel_all()
+        with self._changed:
+            self._changed.wait_for(lambda: not self._pending and not self._running)
         self._pool.__exit__(exc_type, exc_value, traceback)
+        self._watchdog.stop()
         return super().exit_loop(exc_type, exc_value, traceback)
 
-    def _run_job(self, job: LocalJob):
-        proc = subprocess.Popen(
-            job.cmd,
-            cwd=job.cwd,
-            env=job.env,
-            shell=job.shell,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+    @staticmethod
+    def _log_error(future: concurrent.futures.Future):
+        err = future.exception()
+        if err is not None:
+            logger.error(err)
+
+    def _fits(self, job: LocalJob) -> bool:
+        return (
+            self._running < self.config.max_workers
+            and job.cores <= self._free_cores
+            and (job.memory or 0) <= self._free_memory
         )
-        job.pid = proc.pid
-        job.start_time = datetime.now(timezone.utc)
-        self.event_publish(JobStatus.STARTED, job)
 
-        # wait for the job to finish
-        proc.wait()
+    def _start(self, job: LocalJob):
+        self._active[id(job)] = job
+        self._running += 1
+        self._free_cores -= job.cores
+        self._free_memory -= job.memory or 0
+        # finished futures are not kept around, errors are logged as they happen
+        self._pool.submit(self._run_job, job).add_done_callback(self._log_error)
+
+    def _admit(self):
+        """
+        Start every queued job that fits in the free resources. Must be called with the lock held.
+        """
+        while self._pending and self._fits(self._pending[0]):
+            self._start(self._pending.popleft())
+            self._overtaken = 0
+        if not self._pending or self._overtaken >= self.config.max_backfill:
+            return
+
+        # the head of the queue is blocked, backfill smaller jobs around it
+        backfilled = []
+        for i in range(1, min(len(self._pending), self.config.backfill_window + 1)):
+            if self._overtaken >= self.config.max_backfill:
+                break
+            job = self._pending[i]
+            if self._fits(job):
+                self._start(job)
+                self._overtaken += 1
+                backfilled.append(i)
+        for i in reversed(backfilled):
+            del self._pending[i]
+
+    def _prepare(self, job: LocalJob):
+        """
+        Pass the number of cores of the job to the program, via OpenMP and the configured thread flag.
+        """
+        env = dict(os.environ if job.env is None else job.env)
+        env["OMP_NUM_THREADS"] = str(job.cores)
+        job.env = env
+
+        flag = self.config.thread_flag
+        if flag is not None:
+            if isinstance(job.cmd, str):
+                if flag not in job.cmd.split():
+                    job.cmd = f"{job.cmd} {flag} {job.cores}"
+            elif flag not in job.cmd:
+                job.cmd = job.cmd + [flag, str(job.cores)]
+
+    def _signal(self, job: LocalJob, sig: int):
+        """
+        Send a signal to the process group of a running job. Must be called with the lock held.
+        """
+        if id(job) in self._active and job.pid is not None:
+            try:
+                os.killpg(job.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, job: LocalJob):
+        """
+        Terminate a running job, escalating to SIGKILL after the grace period. Must be called with the lock held.
+        """
+        job.cancelled = True
+        self._signal(job, signal.SIGTERM)
+        self._watchdog.schedule(self.config.kill_grace, self._kill, job)
+
+    def _kill(self, job: LocalJob):
+        with self._lock:
+            self._signal(job, signal.SIGKILL)
+
+    def _expire(self, job: LocalJob):
+        with self._lock:
+            if id(job) in self._active:
+                logger.warning(f"Job {job} exceeded its time limit of {job.time_limit}s, stopping it")
+                self._stop(job)
+
+    def _limit_cpu(self, job: LocalJob, pid: int):
+        """
+        Set the CPU time limit of a job on its freshly spawned process.
+        """
+        if job.cpu_time_limit is None:
+            return
+        soft = math.ceil(job.cpu_time_limit)
+        hard = soft + math.ceil(self.config.kill_grace)
+        try:
+            # the kernel sends SIGXCPU past the soft limit and SIGKILL past the hard one
+            resource.prlimit(pid, resource.RLIMIT_CPU, (soft, hard))
+        except ProcessLookupError:
+            pass
+
+    def _execute(self, job: LocalJob):
+        with JobStreams(job, self.config.tail_size) as streams:
+            proc = subprocess.Popen(
+                job.cmd,
+                cwd=job.cwd,
+                env=job.env,
+                shell=job.shell,
+                start_new_session=True,
+                **streams.popen_kwargs,
+            )
+            self._limit_cpu(job, proc.pid)
+            with self._lock:
+                job.pid = proc.pid
+                if job.cancelled:
+                    # cancelled while the process was being spawned
+                    self._stop(job)
+            if job.time_limit is not None:
+                self._watchdog.schedule(job.time_limit, self._expire, job)
+            job.start_time = datetime.now(timezone.utc)
+            job.status = JobStatus.STARTED
+            self.event_publish(JobStatus.STARTED, job)
+            streams.attach(proc)
+
+            # wait for the job to finish
+            job.usage = wait_with_usage(proc)
 
         job.end_time = datetime.now(timezone.utc)
-        job.status = JobStatus.COMPLETED
         job.exit_code = proc.returncode
-        self.event_publish(JobStatus.COMPLETED, job)
+        job.stdout_tail = streams.stdout_tail
+        job.stderr_tail = streams.stderr_tail
+        if job.exit_code != 0 and self.config.tail_size > 0:
+            logger.warning(
+                f"Job {job} exited with code {job.exit_code}\n"
+                f"stdout tail:\n{_decode(job.stdout_tail)}\nstderr tail:\n{_decode(job.stderr_tail)}"
+            )
+
+    def _run_job(self, job: LocalJob):
+        try:
+            # a job cancelled before its process was spawned is not run, but still reported
+            if not job.cancelled:
+                self._execute(job)
+        finally:
+            with self._changed:
+                del self._active[id(job)]
+                self._running -= 1
+                self._free_cores += job.cores
+                self._free_memory += job.memory or 0
+                self._admit()
+                self._changed.notify_all()
+        if job.cancelled:
+            job.status = JobStatus.CANCELLED
+            self.event_publish(JobStatus.CANCELLED, job)
+        else:
+            job.status = JobStatus.COMPLETED
+            self.event_publish(JobStatus.COMPLETED, job)
+
+    def cancel(self, job: Union[Job, str]) -> bool:
+        """
+        Cancel a job, given the job or its name: every queued job of that name is dropped, and every
+        running one is terminated.
+        :return: False if no job of that name is queued nor running
+        """
+        name = job if isinstance(job, str) else job.name
+        with self._changed:
+            cancelled = [queued for queued in self._pending if queued.name == name]
+            if cancelled:
+                self._pending = deque(queued for queued in self._pending if queued.name != name)
+                self._changed.notify_all()
+            running = [active for active in self._active.values() if active.name == name]
+            for active in running:
+                self._stop(active)
+        for queued in cancelled:
+            queued.cancelled = True
+            queued.status = JobStatus.CANCELLED
+            self.event_publish(JobStatus.CANCELLED, queued)
+        return bool(cancelled or running)
+
+    def cancel_all(self):
+        """
+        Cancel every queued job and terminate every running one.
+        """
+        with self._changed:
+            cancelled = list(self._pending)
+            self._pending.clear()
+            for job in self._active.values():
+                self._stop(job)
+            self._changed.notify_all()
+        for job in cancelled:
+            job.cancelled = True
+            job.status = JobStatus.CANCELLED
+            self.event_publish(JobStatus.CANCELLED, job)
 
     def submit(self, job: Job):
-        job = LocalJob(
-            name=job.name, cmd=job.cmd, cwd=job.cwd, env=job.env, shell=job.shell
-        )
+        if job.cores > self.config.cores or (job.memory or 0) > self.config.memory:
+            raise ValueError(
+                f"Job {job} requests {job.cores} cores and {job.memory} MiB, "
+                f"but only {self.config.cores} cores and {self.config.memory} MiB are available"
+            )
+        with self._changed:
+            # block the producer while too many jobs are in flight
+            self._changed.wait_for(lambda: len(self._pending) + self._running < self.config.max_inflight)
+        job = job.copy(LocalJob)
+        if job.time_limit is None:
+            job.time_limit = self.config.time_limit
+        if job.cpu_time_limit is None:
+            job.cpu_time_limit = self.config.cpu_time_limit
+        self._prepare(job)
         job.submitted_time = datetime.now(timezone.utc)
         job.status = JobStatus.SUBMITTED
         self.event_publish(JobStatus.SUBMITTED, job)
@@ -80,7 +393,9 @@ class LocalExecutor(BaseExecutor):
         job.status = JobStatus.QUEUED
         self.event_publish(JobStatus.QUEUED, job)
 
-        self._futures.append(self._pool.submit(self._run_job, job))
+        with self._changed:
+            self._pending.append(job)
+            self._admit()
 
 
 ExecutorFactory.register(LocalExecutorConfig, LocalExecutor)
@@ -1,51 +1,129 @@
 from datetime import datetime, timezone
-from typing_extensions import override
+import logging
+from queue import Empty, Queue
+import threading
+import time
+from typing_extensions import Optional, override
 
 import requests
 
 from bio_autorun.executors.base import BaseExecutor, BaseExecutorConfig, ExecutorFactory
 from bio_autorun.job import Job, JobStatus
 
+logger = logging.getLogger(__name__)
+
 
 class SchedulerExecutorConfig(BaseExecutorConfig):
-    def __init__(self, connect_uri: str, api_key: str, **kwargs):
+    def __init__(self, connect_uri: str, api_key: str, *, queue: Optional[str] = None, priority: int = 0,
+                 batch_size: int = 1000, flush_interval: float = 0.5, max_pending: int = 100000, **kwargs):
+        """
+        :param queue: fair-share queue of the jobs that do not name one, e.g. the experiment name
+        :param priority: priority of the jobs that do not set one; higher runs first
+        :param batch_size: maximum number of jobs sent to the server per request
+        :param flush_interval: maximum number of seconds a submitted job waits before being sent
+        :param max_pending: maximum number of jobs waiting to be sent; submit blocks beyond it
+        """
         super().__init__(**kwargs)
         self.connect_uri = connect_uri
         self.api_key = api_key
+        self.queue = queue
+        self.priority = priority
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
 
 
 class SchedulerExecutor(BaseExecutor):
+    """
+    Send jobs to a scheduler server.
+
+    ``submit`` only queues the job in memory: a background thread sends them to /add_jobs over one
+    keep-alive session, in batches of up to ``batch_size`` jobs, at least every ``flush_interval``
+    seconds. SUBMITTED events are published once the server has accepted the batch, and a failed
+    batch is raised from the next ``submit`` or from leaving ``acquire()``.
+    """
+
     config: SchedulerExecutorConfig
 
+    _STOP = object()
+
     def __init__(self, config: SchedulerExecutorConfig):
         super().__init__(config)
+        self._session = requests.Session()
+        self._session.headers["X-API-KEY"] = config.api_key
+        self._pending: Queue = Queue(config.max_pending)
+        self._sender: Optional[threading.Thread] = None
+        self._error: Optional[Exception] = None
+
+    @override
+    def enter_loop(self):
+        super().enter_loop()
+        self._sender = threading.Thread(target=self._run, name="scheduler-submit", daemon=True)
+        self._sender.start()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("Failed to submit jobs to the scheduler server") from self._error
 
     def submit(self, job: Job):
-        job = Job.from_json(job.to_json())
+        self._check()
+        job = job.copy()
+        job.queue = job.queue or self.config.queue
+        if job.priority is None:
+            job.priority = self.config.priority
         job.submitted_time = datetime.now(timezone.utc)
         job.status = JobStatus.SUBMITTED
+        self._pending.put(job)
 
-        headers = {
-            "Content-Type": "application/json",
-            "X-API-KEY": self.config.api_key
-        }
-        response = requests.post(
-            f"{self.config.connect_uri}/add_job",
-            json=job.to_json(),
-            headers=headers,
-            timeout=10
+    def _send(self, batch: list[Job]):
+        response = self._session.post(
+            f"{self.config.connect_uri}/add_jobs",
+            json=[job.to_json() for job in batch],
+            timeout=60
         )
         response.raise_for_status()
-        self.event_publish(JobStatus.SUBMITTED, job)
+        for job in batch:
+            self.event_publish(JobStatus.SUBMITTED, job)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.config.flush_interval
+            try:
+                while len(batch) < self.config.batch_size:
+                    item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            except Empty:
+                pass
+            if not batch:
+                continue
+            if self._error is not None:
+                logger.error(f"Dropping {len(batch)} jobs after a failed submission")
+                continue
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error(f"Failed to submit {len(batch)} jobs: {e}")
+                self._error = e
 
+    @override
     def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
-        response = requests.post(
-            f"{self.config.connect_uri}/stop_server",
-            headers={"X-API-KEY": self.config.api_key},
-            timeout=10
-        )
-        response.raise_for_status()
-        return super().exit_loop(exc_type, exc_value, traceback)
+        self._pending.put(self._STOP)
+        self._sender.join()
+        try:
+            if exc_type is None:
+                self._check()
+            response = self._session.post(f"{self.config.connect_uri}/stop_server", timeout=10)
+            response.raise_for_status()
+        finally:
+            # the event bus and the journal are stopped even after a failed batch
+            self._session.close()
+            result = super().exit_loop(exc_type, exc_value, traceback)
+        return result
 
 
 ExecutorFactory.register(SchedulerExecutorConfig, SchedulerExecutor)
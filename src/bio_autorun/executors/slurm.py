@@ -1,16 +1,542 @@
+import bisect
 from datetime import datetime, timezone
 import logging
+import math
 import os
-from typing_extensions import override
+from typing_extensions import BinaryIO, Iterable, Iterator, Optional, Sequence, TextIO, override
 
 from bio_autorun.executors.base import BaseExecutor, BaseExecutorConfig, ExecutorFactory
 from bio_autorun.job import Job, JobStatus
 
 logger = logging.getLogger(__name__)
+MAX_ARRAY_SIZE = 1001  # Slurm's default MaxArraySize: array indices go up to 1000
+INDEX_WIDTH = 16  # bytes per entry of the command index: a right-aligned decimal offset and a newline
+# seconds, the time limits arrays are rounded up to: few distinct limits, short enough to be backfilled
+DEFAULT_TIME_CLASSES = (15 * 60, 3600, 4 * 3600, 12 * 3600, 24 * 3600, 3 * 24 * 3600)
+
+
+class CommandList:
+    """
+    List of shell commands, one per line, written with a fixed-width index ``<path>.idx`` holding the
+    byte offset of every command, then the size of the list. Array tasks find their command by seeking
+    to ``(n - 1) * INDEX_WIDTH`` in the index and then to the offset in the list, rather than scanning
+    the list from the top, which costs O(n^2) reads on the shared filesystem over a whole array.
+
+    With ``estimates``, the runtime estimate and time limit of every command are streamed to
+    ``<path>.est`` as well, for ``write_arrays`` to chunk and pack the commands without holding them
+    in memory; see ``read_estimates``.
+    """
+
+    def __init__(self, path: str, mode: str = "x", estimates: bool = False):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.estimates_path = f"{path}.est"
+        self.count = 0
+        self.limited = 0  # commands written with a time limit
+        self._offset = 0
+        # binary, to count the offsets in bytes
+        self._file: BinaryIO = open(path, mode + "b")
+        self._index: BinaryIO = open(self.index_path, mode + "b")
+        self._estimates: Optional[TextIO] = open(self.estimates_path, mode) if estimates else None
+        # left by a previous list of the same name
+        for stale in ([] if estimates else [self.estimates_path]) + [f"{path}.done"]:
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    def write(self, command: str, runtime: Optional[float] = None, limit: Optional[float] = None):
+        """
+        Append a command, with its estimated runtime and time limit in seconds when the list keeps them.
+        """
+        data = f"{command}\n".encode()
+        self._index.write(f"{self._offset:{INDEX_WIDTH - 1}d}\n".encode())
+        self._file.write(data)
+        self._offset += len(data)
+        self.count += 1
+        if self._estimates is not None:
+            self._estimates.write(f"{_format_estimate(runtime)} {_format_estimate(limit)}\n")
+            if limit is not None:
+                self.limited += 1
+
+    def close(self):
+        if not self._index.closed:
+            self._index.write(f"{self._offset:{INDEX_WIDTH - 1}d}\n".encode())
+        self._file.close()
+        self._index.close()
+        if self._estimates is not None:
+            self._estimates.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+        os.remove(self.index_path)
+        if self._estimates is not None:
+            os.remove(self.estimates_path)
+
+
+def _format_estimate(seconds: Optional[float]) -> str:
+    return f"{'-' if seconds is None else f'{seconds:.1f}':>{INDEX_WIDTH - 1}}"
+
+
+def read_estimates(cmd_list_path: str) -> Iterator[tuple[Optional[float], Optional[float]]]:
+    """
+    Runtime estimate and time limit of every command of a ``CommandList`` written with ``estimates``,
+    in order, read one line at a time. Unknown values are None.
+    """
+    with open(f"{cmd_list_path}.est") as f:
+        for line in f:
+            runtime, limit = line.split()
+            yield (None if runtime == "-" else float(runtime)), (None if limit == "-" else float(limit))
+
+
+class _CommandReader:
+    """
+    Random access to the commands of a closed ``CommandList`` through its index, numbered from 1.
+    """
+
+    def __init__(self, cmd_list_path: str):
+        self._file = open(cmd_list_path, "rb")
+        self._index = open(f"{cmd_list_path}.idx", "rb")
+
+    def __getitem__(self, number: int) -> bytes:
+        """
+        Command ``number``, with its newline.
+        """
+        self._index.seek((number - 1) * INDEX_WIDTH)
+        start, end = self._index.read(2 * INDEX_WIDTH).split()
+        self._file.seek(int(start))
+        return self._file.read(int(end) - int(start))
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_entries(path: str, skip: str, width: int, count: int = 1) -> str:
+    """
+    Shell expression reading ``count`` entries of a file of fixed-width lines after the first ``skip``
+    ones, by seeking to them with one dd.
+    """
+    return f"$(dd if={path} bs={width} skip=$(( {skip} )) count={count} status=none)"
+
+
+def _read_commands(cmd_list_path: str, first: str, last: str) -> tuple[list[str], str]:
+    """
+    Shell lines setting ``start`` and ``end`` to the byte range of commands ``first`` to ``last`` of a
+    ``CommandList``, and the command printing them.
+    """
+    index = f"{cmd_list_path}.idx"
+    if first == last:
+        # both offsets are on their own line, read up to the end of the input
+        seek = [f"read -d '' start end <<< {_read_entries(index, f'{first} - 1', INDEX_WIDTH, 2)}"]
+    else:
+        seek = [f"start={_read_entries(index, f'{first} - 1', INDEX_WIDTH)}",
+                f"end={_read_entries(index, last, INDEX_WIDTH)}"]
+    read = (f"dd if={cmd_list_path} iflag=skip_bytes,count_bytes skip=$(( start )) count=$(( end - start )) "
+            f"status=none")
+    return seek, read
+
+
+def _mark_done(cmd_list_path: str) -> str:
+    """
+    Shell function ``mark_done N`` appending command number N of a ``CommandList`` to its journal of
+    completed commands, ``<path>.done``, under a lock: appends are not atomic across NFS clients.
+    """
+    return f'mark_done() {{ {{ flock 9 && echo "$1" >&9; }} 9>> {cmd_list_path}.done; }}'
+
+
+def count_commands(cmd_list_path: str) -> int:
+    """
+    Number of commands of a closed ``CommandList``, from the size of its index.
+    """
+    return os.path.getsize(f"{cmd_list_path}.idx") // INDEX_WIDTH - 1
+
+
+def completed_commands(cmd_list_path: str) -> set[int]:
+    """
+    Numbers of the commands of a ``CommandList`` that array tasks recorded as successful.
+    """
+    done = set()
+    try:
+        with open(f"{cmd_list_path}.done") as f:
+            for line in f:
+                # a line can be cut short if its task was killed while writing it
+                if line.endswith("\n") and line.strip().isdigit():
+                    done.add(int(line))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def compress_ranges(numbers: Iterable[int]) -> str:
+    """
+    Sorted numbers in the range syntax of sbatch --array, e.g. ``1-5,9,12-20``.
+    """
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def chunk_commands(
+    count: int,
+    chunk_size: Optional[int] = None,
+    runtimes: Optional[Iterable[Optional[float]]] = None,
+    target_runtime: Optional[float] = None,
+) -> list[tuple[int, int]]:
+    """
+    Split ``count`` commands into chunks of consecutive commands, each run by one array task.
+    Returns the first and last command of every chunk, numbered from 1.
+
+    Without ``target_runtime``, chunks have ``chunk_size`` commands (default: 1). With it, commands are
+    added to a chunk until their estimated ``runtimes`` add up to the target, and ``chunk_size`` caps the
+    number of commands per chunk; commands without an estimate get a chunk of their own.
+    """
+    if target_runtime is None:
+        size = chunk_size or 1
+        return [(first, min(first + size - 1, count)) for first in range(1, count + 1, size)]
+    chunks = []
+    first, total = 1, 0.0
+    runtimes = iter(runtimes) if runtimes is not None else None
+    for i in range(1, count + 1):
+        runtime = next(runtimes) if runtimes is not None else None
+        runtime = target_runtime if runtime is None else runtime
+        if i > first and (total + runtime > target_runtime or i - first == chunk_size):
+            chunks.append((first, i - 1))
+            first, total = i, 0.0
+        total += runtime
+    if count:
+        chunks.append((first, count))
+    return chunks
+
+
+def job_time_limit(job: Job, margin: Optional[float] = None) -> Optional[float]:
+    """
+    Wall-clock seconds a job may take: its ``time_limit``, or with ``margin``, its runtime estimate
+    scaled by it. None if neither is known.
+    """
+    if job.time_limit is not None:
+        return job.time_limit
+    if margin is not None and job.runtime_estimate is not None:
+        return job.runtime_estimate * margin
+    return None
+
+
+def time_class(limit: float, time_classes: Sequence[float] = DEFAULT_TIME_CLASSES) -> float:
+    """
+    Smallest of ``time_classes`` that is at least ``limit``, or ``limit`` rounded up to the hour above them.
+    """
+    for bound in sorted(time_classes):
+        if limit <= bound:
+            return bound
+    return math.ceil(limit / 3600) * 3600
+
+
+def slurm_time(seconds: float) -> str:
+    """
+    Time limit in the days-hours:minutes:seconds format of sbatch --time, rounded up to the minute.
+    """
+    days, minutes = divmod(math.ceil(seconds / 60), 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{days}-{hours:02d}:{minutes:02d}:00"
+
+
+def pack_commands(
+    limits: Iterable[Optional[float]],
+    time_classes: Sequence[float] = DEFAULT_TIME_CLASSES,
+    pack_time: Optional[float] = None,
+    chunk_size: Optional[int] = None,
+    parallel: bool = False,
+) -> list[tuple[Optional[float], list[list[int]]]]:
+    """
+    Group commands, numbered from 1, into array tasks by their time ``limits``: one array per time class
+    (see ``time_class``), so that each array asks for a limit close to what its tasks need.
+
+    Commands whose limit is below ``pack_time`` are bin-packed (best fit decreasing) into tasks of up to
+    ``pack_time`` seconds and ``chunk_size`` commands. With ``parallel``, a task takes as long as its
+    longest command, so they are grouped by ``chunk_size`` in decreasing order instead. Commands without
+    a limit are not packed.
+
+    Returns the time limit and the tasks of every array, shortest limit first; the array of the commands
+    without a limit comes last, with a None limit.
+    """
+    tasks: list[tuple[float, list[int]]] = []
+    unlimited = []
+    short = []
+    for i, limit in enumerate(limits, 1):
+        if limit is None:
+            unlimited.append([i])
+        elif pack_time is not None and limit < pack_time:
+            short.append((limit, i))
+        else:
+            tasks.append((limit, [i]))
+    short.sort(reverse=True)
+    if parallel:
+        size = chunk_size or 1
+        for k in range(0, len(short), size):
+            tasks.append((short[k][0], [i for _, i in short[k:k + size]]))
+    else:
+        bins: list[list[int]] = []
+        loads: list[float] = []
+        free: list[tuple[float, int]] = []  # (capacity left, bin) of the bins that can take more, sorted
+        for limit, i in short:
+            k = bisect.bisect_left(free, (limit, -1))
+            if k < len(free):
+                left, b = free.pop(k)
+            else:
+                left, b = pack_time, len(bins)
+                bins.append([])
+                loads.append(0.0)
+            bins[b].append(i)
+            loads[b] += limit
+            if chunk_size is None or len(bins[b]) < chunk_size:
+                bisect.insort(free, (left - limit, b))
+        tasks.extend(zip(loads, bins))
+    arrays: dict[float, list[list[int]]] = {}
+    for limit, task in tasks:
+        arrays.setdefault(time_class(limit, time_classes), []).append(task)
+    result: list[tuple[Optional[float], list[list[int]]]] = sorted(arrays.items())
+    if unlimited:
+        result.append((None, unlimited))
+    return result
+
+
+def _time_class_name(limit: Optional[float]) -> str:
+    if limit is None:
+        return "nolimit"
+    for unit, seconds in (("d", 86400), ("h", 3600), ("m", 60)):
+        if limit % seconds == 0:
+            return f"{int(limit // seconds)}{unit}"
+    return f"{int(limit)}s"
+
+
+def array_script_paths(path: str, parts: int) -> list[str]:
+    """
+    Paths of the batch scripts of an array split in ``parts``: ``path`` itself if it is not split,
+    otherwise ``job.sh`` gives ``job.1.sh``, ``job.2.sh``, ...
+    """
+    if parts == 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}.{i}{ext}" for i in range(1, parts + 1)]
+
+
+def array_scripts(
+    batch_name: str,
+    cmd_list_path: str,
+    chunks: list[tuple[int, int]],
+    *,
+    hold: bool = False,
+    parallel: bool = False,
+    max_array_size: int = MAX_ARRAY_SIZE,
+    time_limit: Optional[float] = None,
+    only: Optional[set[int]] = None,
+) -> tuple[list[str], Optional[str]]:
+    """
+    Batch scripts running the commands of ``cmd_list_path`` as job arrays, one array task per chunk.
+    The commands of a chunk run one after the other, or all at once with ``parallel``, on as many CPUs
+    as the largest chunk has commands. An array task fails if any of its commands fails.
+
+    Arrays longer than ``max_array_size - 1`` tasks are split into several scripts, to be submitted
+    each. Returns the scripts, and the content of the chunk file ``<cmd_list_path>.chunks`` that they
+    read when chunks are not all of the same size (None otherwise). The commands are looked up in the
+    index of a ``CommandList``, and so are the chunks, in a file of fixed-width lines.
+
+    ``time_limit`` is the --time of every task, in seconds. With ``only``, the arrays are restricted to
+    these chunks, numbered from 1, and scripts left without any are not returned.
+
+    Every command that succeeds is recorded in the journal ``<cmd_list_path>.done``, see
+    ``completed_commands``.
+    """
+    size = max((last - first + 1 for first, last in chunks), default=1)
+    # chunks of a fixed size, but the last one, are found by arithmetic
+    uniform = all(first == i * size + 1 for i, (first, _) in enumerate(chunks))
+    chunk_file = None if uniform else f"{cmd_list_path}.chunks"
+    per_script = max_array_size - 1
+    scripts = []
+    for offset in range(0, max(len(chunks), 1), per_script):
+        tasks = min(per_script, len(chunks) - offset)
+        indices = f"1-{tasks}"
+        if only is not None:
+            selected = [i - offset for i in range(offset + 1, offset + tasks + 1) if i in only]
+            if not selected:
+                continue
+            indices = compress_ranges(selected)
+        lines = ["#!/bin/bash"]
+        if hold:
+            lines.append("#SBATCH --hold")
+        lines.append(f"#SBATCH --job-name={batch_name}")
+        lines.append("#SBATCH --ntasks=1")
+        lines.append(f"#SBATCH --cpus-per-task={size if parallel else 1}")
+        lines.append(f"#SBATCH --array={indices}")
+        if time_limit is not None:
+            lines.append(f"#SBATCH --time={slurm_time(time_limit)}")
+        lines.append("#SBATCH --output=slurm-log/slurm-%A_%a.out")
+        lines.append(_mark_done(cmd_list_path))
+        task = "SLURM_ARRAY_TASK_ID" if not offset else f"(SLURM_ARRAY_TASK_ID + {offset})"
+        if size == 1:
+            if offset:
+                lines.append(f"task=$(( {task} ))")
+                task = "task"
+            seek, read = _read_commands(cmd_list_path, task, task)
+            lines.extend(seek)
+            lines.append(f"command=$({read})")
+            lines.append(f"eval $command && mark_done ${task}")
+        else:
+            if uniform:
+                lines.append(f"first=$(( ({task} - 1) * {size} + 1 ))")
+                count = chunks[-1][1]
+                lines.append(f"last=$(( {task} * {size} < {count} ? {task} * {size} : {count} ))")
+            else:
+                lines.append(f"read first last <<< {_read_entries(chunk_file, f'{task} - 1', 2 * INDEX_WIDTH)}")
+            seek, commands = _read_commands(cmd_list_path, "first", "last")
+            lines.extend(seek)
+            lines.append("status=0")
+            lines.append("i=$first")
+            if parallel:
+                lines.append("pids=()")
+            lines.append("while IFS= read -r command; do")
+            if parallel:
+                lines.append('    { eval "$command" < /dev/null && mark_done $i; } &')
+                lines.append("    pids+=($!)")
+                lines.append("    i=$(( i + 1 ))")
+                lines.append(f"done < <({commands})")
+                lines.append('for pid in "${pids[@]}"; do')
+                lines.append("    wait $pid || status=$?")
+                lines.append("done")
+            else:
+                lines.append('    if eval "$command" < /dev/null; then')
+                lines.append("        mark_done $i")
+                lines.append("    else")
+                lines.append("        status=$?")
+                lines.append("    fi")
+                lines.append("    i=$(( i + 1 ))")
+                lines.append(f"done < <({commands})")
+            lines.append("exit $status")
+        scripts.append("\n".join(lines) + "\n")
+    chunk_data = None if uniform else "".join(
+        f"{first:{INDEX_WIDTH - 1}d} {last:{INDEX_WIDTH - 1}d}\n" for first, last in chunks
+    )
+    return scripts, chunk_data
+
+
+def write_arrays(
+    batch_name: str,
+    batch_script_path: str,
+    commands: CommandList,
+    *,
+    chunk_size: Optional[int] = None,
+    chunk_runtime: Optional[float] = None,
+    parallel: bool = False,
+    time_classes: Sequence[float] = DEFAULT_TIME_CLASSES,
+    max_array_size: int = MAX_ARRAY_SIZE,
+    hold: bool = False,
+    mode: str = "x",
+) -> list[str]:
+    """
+    Write the batch scripts running the commands of a closed ``CommandList``, returning their paths.
+
+    The runtime estimates and time limits of the commands are streamed from the list, when it was
+    written with ``estimates``. Without time limits, the commands run in their order, chunked by
+    ``chunk_commands``. With them, they are grouped by ``pack_commands`` (``chunk_runtime`` being the
+    time packed per task) into one array per time class, each with its own copy of the commands in task
+    order, ``<cmd_list>.<class>``, e.g. ``iqtree.cmd.4h``, copied one at a time through the index.
+
+    The command lists the arrays run and their time limits are listed in ``<cmd_list>.arrays``, for
+    ``write_resubmission``.
+    """
+    estimated = os.path.exists(commands.estimates_path)
+    if not commands.limited:
+        runtimes = (runtime for runtime, _ in read_estimates(commands.path)) if estimated else None
+        arrays = [(None, commands.path, chunk_commands(commands.count, chunk_size, runtimes, chunk_runtime))]
+    else:
+        limits = (limit for _, limit in read_estimates(commands.path))
+        arrays = []
+        with _CommandReader(commands.path) as reader:
+            for limit, tasks in pack_commands(limits, time_classes, chunk_runtime, chunk_size, parallel):
+                path = f"{commands.path}.{_time_class_name(limit)}"
+                group = CommandList(path, mode)
+                chunks = []
+                for task in tasks:
+                    first = group.count + 1
+                    for i in task:
+                        group.write(reader[i].decode()[:-1])
+                    chunks.append((first, group.count))
+                group.close()
+                arrays.append((limit, path, chunks))
+    scripts = []
+    for limit, path, chunks in arrays:
+        texts, chunk_data = array_scripts(batch_name, path, chunks, hold=hold, parallel=parallel,
+                                          max_array_size=max_array_size, time_limit=limit)
+        if chunk_data is not None:
+            with open(f"{path}.chunks", mode) as f:
+                f.write(chunk_data)
+        scripts.extend(texts)
+        time = slurm_time(limit) if limit is not None else "no"
+        count = chunks[-1][1] if chunks else 0
+        logger.info(f"{count} commands of {path} in {len(chunks)} array tasks, {time} time limit")
+    with open(f"{commands.path}.arrays", mode) as f:
+        for limit, path, _ in arrays:
+            f.write(f"{limit if limit is not None else 'none'}\t{path}\n")
+    paths = array_script_paths(batch_script_path, len(scripts))
+    for path, script in zip(paths, scripts):
+        with open(path, mode) as f:
+            f.write(script)
+    return paths
+
+
+def write_resubmission(
+    batch_name: str,
+    batch_script_path: str,
+    cmd_list_path: str,
+    *,
+    hold: bool = False,
+    max_array_size: int = MAX_ARRAY_SIZE,
+    mode: str = "x",
+) -> list[str]:
+    """
+    Write batch scripts running again the commands of a previous ``write_arrays`` that were not recorded
+    as completed: those that failed, and those whose task did not run to the end, e.g. preempted.
+    Returns their paths, none if every command completed.
+
+    The arrays read the original command lists, one command per task, with the time limits they had;
+    ``--array`` only lists the missing commands, e.g. ``--array=1-5,9,12-20``. Completions keep being
+    recorded in the same journals, so this can be repeated until nothing is left.
+    """
+    arrays: list[tuple[Optional[float], str]] = [(None, cmd_list_path)]
+    if os.path.exists(f"{cmd_list_path}.arrays"):
+        arrays = []
+        with open(f"{cmd_list_path}.arrays") as f:
+            for line in f:
+                limit, path = line.rstrip("\n").split("\t", 1)
+                arrays.append((float(limit) if limit != "none" else None, path))
+    scripts = []
+    for limit, path in arrays:
+        count = count_commands(path)
+        missing = set(range(1, count + 1)) - completed_commands(path)
+        logger.info(f"{len(missing)} of {count} commands of {path} to run again")
+        if not missing:
+            continue
+        texts, _ = array_scripts(batch_name, path, [(i, i) for i in range(1, count + 1)], hold=hold,
+                                 max_array_size=max_array_size, time_limit=limit, only=missing)
+        scripts.extend(texts)
+    paths = array_script_paths(batch_script_path, len(scripts)) if scripts else []
+    for path, script in zip(paths, scripts):
+        with open(path, mode) as f:
+            f.write(script)
+    return paths
 
 
 class SlurmJob(Job):
-    pass
+    __slots__ = ()
 
 
 class BaseSlurmExecutorConfig(BaseExecutorConfig):
@@ -32,60 +558,103 @@ class BaseSlurmExecutorConfig(BaseExecutorConfig):
 class BaseSlurmExecutor(BaseExecutor):
     config: BaseSlurmExecutorConfig
 
+    _estimates = False  # whether the command list keeps the runtime estimates and time limits
+
     def __init__(self, config: BaseSlurmExecutorConfig):
         super().__init__(config)
-        self.cmd_list: list[str] = None
+        self._commands: Optional[CommandList] = None
+        self.num_commands = 0
 
     @override
     def enter_loop(self):
         super().enter_loop()
-        self.cmd_list = []
+        # commands are streamed to the file as they are submitted instead of being kept in memory
+        self._commands = CommandList(self.config.cmd_list_path, estimates=self._estimates)
+        self.num_commands = 0
 
-    def submit(self, job: Job):
-        job = SlurmJob(
-            name=job.name, cmd=job.cmd, cwd=job.cwd, env=job.env, shell=job.shell
-        )
-        if isinstance(job.cmd, str):
-            self.cmd_list.append(job.cmd)
+    @override
+    def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
+        if exc_type is not None:
+            # leave nothing behind that could be submitted by mistake
+            self._commands.remove()
         else:
-            self.cmd_list.append("'" + "' '".join(job.cmd) + "'")
+            self._commands.close()
+        return super().exit_loop(exc_type, exc_value, traceback)
+
+    def _time_limit(self, job: Job) -> Optional[float]:
+        return job.time_limit
+
+    def submit(self, job: Job):
+        job = job.copy(SlurmJob)
+        cmd = job.cmd if isinstance(job.cmd, str) else "'" + "' '".join(job.cmd) + "'"
+        self._commands.write(cmd, job.runtime_estimate, self._time_limit(job))
+        self.num_commands += 1
         job.submitted_time = datetime.now(timezone.utc)
         job.status = JobStatus.SUBMITTED
         self.event_publish(JobStatus.SUBMITTED, job)
 
 
 class SlurmExecutorConfig(BaseSlurmExecutorConfig):
-    pass
+    def __init__(self, *, chunk_size: Optional[int] = None, chunk_runtime: Optional[float] = None,
+                 chunk_parallel: bool = False, max_array_size: int = MAX_ARRAY_SIZE,
+                 time_margin: Optional[float] = None, time_classes: Sequence[float] = DEFAULT_TIME_CLASSES,
+                 **kwargs):
+        """
+        :param chunk_size: number of commands run by each array task (default: 1); with chunk_runtime,
+            the maximum number of commands per task (default: no limit)
+        :param chunk_runtime: seconds of estimated runtime (Job.runtime_estimate) to pack into each
+            array task, for many short jobs; of time limit when the jobs have one
+        :param chunk_parallel: run the commands of a task all at once instead of one after the other
+        :param max_array_size: MaxArraySize of the cluster; longer arrays are split into several batch
+            scripts, ``job.1.sh``, ``job.2.sh``, ... for ``batch_script_path=job.sh``
+        :param time_margin: give the jobs without a Job.time_limit their runtime estimate times this
+            margin as time limit, e.g. 1.5; by default they are not limited
+        :param time_classes: seconds, the time limits of the arrays; jobs with a time limit are grouped in
+            one array per class, see ``pack_commands``
+        """
+        super().__init__(**kwargs)
+        self.chunk_size = chunk_size
+        self.chunk_runtime = chunk_runtime
+        self.chunk_parallel = chunk_parallel
+        self.max_array_size = max_array_size
+        self.time_margin = time_margin
+        self.time_classes = time_classes
 
 
 class SlurmExecutor(BaseSlurmExecutor):
+    config: SlurmExecutorConfig
+
+    _estimates = True
+
+    @override
+    def _time_limit(self, job: Job) -> Optional[float]:
+        return job_time_limit(job, self.config.time_margin)
+
     @override
     def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
         if exc_type is None:
-            with open(self.config.cmd_list_path, "x") as f:
-                for cmd in self.cmd_list:
-                    f.write(f"{cmd}\n")
-
-            with open(self.config.batch_script_path, "x") as f:
-                f.write("#!/bin/bash\n")
-                if self.config.hold:
-                    f.write(f"#SBATCH --hold\n")
-                f.write(f"#SBATCH --job-name={self.config.batch_name}\n")
-                f.write(f"#SBATCH --ntasks=1\n")
-                f.write(f"#SBATCH --cpus-per-task=1\n")
-                f.write(f"#SBATCH --array=1-{len(self.cmd_list)}\n")
-                f.write(f"#SBATCH --output=slurm-log/slurm-%A_%a.out\n")
-                f.write(
-                    f'command=$(sed "${{SLURM_ARRAY_TASK_ID}}q;d" {self.config.cmd_list_path})\n'
-                )
-                f.write("eval $command\n")
+            self._commands.close()
+            paths = write_arrays(
+                self.config.batch_name, self.config.batch_script_path, self._commands,
+                chunk_size=self.config.chunk_size,
+                chunk_runtime=self.config.chunk_runtime, parallel=self.config.chunk_parallel,
+                time_classes=self.config.time_classes, max_array_size=self.config.max_array_size,
+                hold=self.config.hold
+            )
+            logger.info(f"{self.num_commands} commands to submit with: {', '.join(paths)}")
         return super().exit_loop(exc_type, exc_value, traceback)
 
 
 class PreallocSlurmExecutorConfig(BaseSlurmExecutorConfig):
-    def __init__(self, srun_runner_script: str = None, **kwargs):
+    def __init__(self, srun_runner_script: str = None, *, dynamic: bool = True, **kwargs):
+        """
+        :param dynamic: hand out commands to the ranks of the allocation as they free up, from a counter
+            in a file next to the command list (which must support flock); otherwise rank r runs the
+            commands r, r + ntasks, r + 2 * ntasks, ...
+        """
         super().__init__(**kwargs)
         self.srun_runner_script = srun_runner_script
+        self.dynamic = dynamic
 
 
 class PreallocSlurmExecutor(BaseSlurmExecutor):
@@ -94,21 +663,34 @@ class PreallocSlurmExecutor(BaseSlurmExecutor):
     @override
     def exit_loop(self, exc_type=None, exc_value=None, traceback=None):
         if exc_type is None:
-            # The list of commands is written to a file
-            with open(self.config.cmd_list_path, "x") as f:
-                for cmd in self.cmd_list:
-                    f.write(f"{cmd}\n")
-
-            # The runner script is created to run multiple commands in order
+            # The runner script is created to run multiple commands, usage: runner <cmd_list> [start] [end].
+            # Each rank takes the next command from the counter file named by $AUTORUN_COUNTER when it is
+            # set, or strides over the commands by its rank.
+            seek, read = _read_commands('"$cmd_list"', "i + 1", "i + 1")
             with open(self.config.srun_runner_script, "x") as f:
                 f.write("#!/bin/bash\n")
-                f.write('readarray -t commands < "$1"\n')
-                f.write("start=${2:-0}\n")
-                f.write("end=${3:-${#commands[@]}}\n")
-                f.write(
-                    "for (( i=start+$SLURM_PROCID; i<end; i+=$SLURM_NTASKS )); do\n"
-                )
-                f.write("    eval ${commands[i]} < /dev/null\n")
+                f.write("cmd_list=$1\n")
+                f.write("from=${2:-0}\n")
+                f.write(f'to=${{3:-$(( $(stat -c %s "$cmd_list".idx) / {INDEX_WIDTH} - 1 ))}}\n')
+                f.write(_mark_done('"$cmd_list"') + "\n")
+                f.write('if [[ -n "$AUTORUN_COUNTER" ]]; then\n')
+                f.write("    take() {\n")
+                f.write("        {\n")
+                f.write('            flock 9 || { echo "Cannot lock $AUTORUN_COUNTER" >&2; exit 1; }\n')
+                f.write('            read -r i < "$AUTORUN_COUNTER"\n')
+                f.write('            echo $(( i + 1 )) > "$AUTORUN_COUNTER"\n')
+                # read-write: over NFS flock becomes a POSIX lock, which needs a writable descriptor
+                f.write('        } 9<> "$AUTORUN_COUNTER"\n')
+                f.write("    }\n")
+                f.write("else\n")
+                f.write("    i=$(( from + SLURM_PROCID - SLURM_NTASKS ))\n")
+                f.write("    take() { i=$(( i + SLURM_NTASKS )); }\n")
+                f.write("fi\n")
+                f.write("while take && (( i < to )); do\n")
+                for line in seek:
+                    f.write(f"    {line}\n")
+                f.write(f"    command=$({read})\n")
+                f.write("    eval $command < /dev/null && mark_done $(( i + 1 ))\n")
                 f.write("done\n")
             os.chmod(self.config.srun_runner_script, 0o700)
 
@@ -120,9 +702,15 @@ class PreallocSlurmExecutor(BaseSlurmExecutor):
                 assert os.path.exists(self.config.srun_runner_script)
                 f.write(f"#SBATCH --job-name={self.config.batch_name}\n")
                 f.write(f"#SBATCH --output=slurm-log/slurm-%A.out\n")
+                if self.config.dynamic:
+                    # on the shared filesystem, for the ranks on every node
+                    f.write(f"export AUTORUN_COUNTER={self.config.cmd_list_path}.next.$SLURM_JOB_ID\n")
+                    f.write('echo "${1:-0}" > "$AUTORUN_COUNTER"\n')
                 f.write(
                     f'srun {self.config.srun_runner_script} {self.config.cmd_list_path} "$@"\n'
                 )
+                if self.config.dynamic:
+                    f.write('rm -f "$AUTORUN_COUNTER"\n')
         return super().exit_loop(exc_type, exc_value, traceback)
 
 
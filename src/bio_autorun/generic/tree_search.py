@@ -2,6 +2,7 @@ import logging
 import os
 
 from bio_autorun.job import Job
+from bio_autorun.predictor import MakespanReport
 from bio_autorun.task import Task
 
 
@@ -10,7 +11,7 @@ logger = logging.getLogger(__name__)
 
 class GenericTreeSearchBase(Task):
     def __init__(self, *args, commands, dataset, output, seeds, stdin_str=None, stdin=None,
-                 stdout=None, stderr=None, **kwargs):
+                 stdout=None, stderr=None, cores=1, memory=None, predictor=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.commands = commands
         self.dataset = dataset
@@ -20,40 +21,64 @@ class GenericTreeSearchBase(Task):
         self.stdin = stdin
         self.stdout = stdout
         self.stderr = stderr
+        self.cores = cores
+        self.memory = memory
+        self.predictor = predictor
 
 
 class GenericTreeSearch(GenericTreeSearchBase):
+    def _jobs(self):
+        for msa in self.dataset:
+            for command_name, command in self.commands.items():
+                for seed in self.seeds:
+                    job_name = f"{msa.name}_{command_name}_{seed}"
+                    if self.executor.is_completed(job_name):
+                        logger.debug(f"Job {job_name} already completed according to the journal. Skipping.")
+                        continue
+                    prefix = f"{self.output}/{job_name}"
+
+                    # build context
+                    context = {
+                        "name": job_name,
+                        "msa": msa.path,
+                        "seed": seed,
+                        "prefix": prefix,
+                        "msa_type": "prot" if msa.category == "protein" else msa.category,
+                        "cores": self.cores,
+                    }
+
+                    # build arguments
+                    assert isinstance(command, list)
+                    parsed_command = []
+                    for arg in command:
+                        parsed_command.append(arg.format(**context))
+
+                    yield msa, command_name, Job(
+                        name=job_name,
+                        cmd=parsed_command,
+                        stdin=self.stdin.format(**context) if self.stdin else None,
+                        stdout=self.stdout.format(**context) if self.stdout else None,
+                        stderr=self.stderr.format(**context) if self.stderr else None,
+                        stdin_str=self.stdin_str.format(**context) if self.stdin_str else None,
+                        cores=self.cores,
+                        memory=self.memory,
+                        inputs=[msa.path],
+                    )
+
     def __call__(self, *args, **kwargs):
+        report = None
+        if self.predictor is not None:
+            # submit the longest jobs first to minimize the makespan
+            jobs = self.predictor.longest_first(self._jobs())
+            report = MakespanReport(getattr(self.executor.config, "max_workers", 1), jobs)
+            report.attach(self.executor)
+        else:
+            jobs = (job for _, _, job in self._jobs())
+
         with self.executor.acquire():
             if not os.path.exists(self.output):
                 logger.info(f"Creating output directory: {self.output}")
                 os.makedirs(self.output)
-            for msa in self.dataset:
-                for command_name, command in self.commands.items():
-                    for seed in self.seeds:
-                        job_name = f"{msa.name}_{command_name}_{seed}"
-                        prefix = f"{self.output}/{job_name}"
-
-                        # build context
-                        context = {
-                            "name": job_name,
-                            "msa": msa.path,
-                            "seed": seed,
-                            "prefix": prefix,
-                            "msa_type": "prot" if msa.category == "protein" else msa.category,
-                        }
-
-                        # build arguments
-                        assert isinstance(command, list)
-                        parsed_command = []
-                        for arg in command:
-                            parsed_command.append(arg.format(**context))
-
-                        self.executor.submit(Job(
-                            name=job_name,
-                            cmd=parsed_command,
-                            stdin=self.stdin.format(**context) if self.stdin else None,
-                            stdout=self.stdout.format(**context) if self.stdout else None,
-                            stderr=self.stderr.format(**context) if self.stderr else None,
-                            stdin_str=self.stdin_str.format(**context) if self.stdin_str else None,
-                        ))
+            self.executor.submit_many(jobs)
+        if report is not None:
+            logger.info(report)
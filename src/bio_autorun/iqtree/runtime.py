@@ -4,6 +4,7 @@ from bio_autorun.msa import MSA, treebase_load
 from bio_autorun.iqtree.settings import Settings
 from dataclasses import dataclass
 import os
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +17,7 @@ class JobResult:
     cpu_time: float
     iters: int
     log_path: str
+    wall_time: Optional[float] = None
 
 
 class JobResultParser:
@@ -47,6 +49,10 @@ class JobResultParser:
                 if cpu_time_match.group(3):
                     self.cpu_time += int(cpu_time_match.group(3))
 
+            # Extract wall-clock time
+            wall_time_match = re.search(r"^Wall-clock time used for tree search: (\d+\.\d+) sec", content, re.M)
+            self.wall_time = float(wall_time_match.group(1)) if wall_time_match else None
+
             # extract number of iters
             iters_match = re.search(r"^TREE SEARCH COMPLETED AFTER (\d+) ITERATIONS", content, re.M)
             self.iters = int(iters_match.group(1)) if iters_match else None
@@ -55,6 +61,7 @@ class JobResultParser:
             cpu_time=self.cpu_time,
             iters=self.iters,
             log_path=log_path,
+            wall_time=self.wall_time,
         )
 
 
@@ -1,4 +1,6 @@
-from datetime import datetime
+from dataclasses import asdict, astuple, dataclass
+from datetime import datetime, timedelta, timezone
+import marshal
 from typing import Optional, Union
 import sys
 
@@ -24,16 +26,83 @@ else:
         COMPLETED = "completed"
         CANCELLED = "cancelled"
 
+@dataclass(frozen=True)
+class ResourceUsage:
+    """
+    Resources consumed by a job, as reported by the kernel when the process is reaped.
+    """
+    user_time: float  # seconds
+    system_time: float  # seconds
+    max_rss: int  # KiB
+    block_in: int
+    block_out: int
+    voluntary_switches: int
+    involuntary_switches: int
+
+    @classmethod
+    def from_rusage(cls, rusage) -> "ResourceUsage":
+        return cls(
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss,
+            block_in=rusage.ru_inblock,
+            block_out=rusage.ru_oublock,
+            voluntary_switches=rusage.ru_nvcsw,
+            involuntary_switches=rusage.ru_nivcsw,
+        )
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ResourceUsage":
+        return cls(**data)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_STATUSES = tuple(JobStatus)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+_CODEC_VERSION = 4
+
+
+def _encode_time(time: Optional[datetime]) -> Optional[int]:
+    if time is None:
+        return None
+    if time.tzinfo is None:
+        time = time.astimezone(timezone.utc)
+    return (time - _EPOCH) // _MICROSECOND
+
+
+def _decode_time(value: Optional[int]) -> Optional[datetime]:
+    return None if value is None else _EPOCH + timedelta(microseconds=value)
+
+
 class Job:
+    __slots__ = (
+        "name", "cmd", "env", "cwd", "shell", "stdin", "stdout", "stderr", "stdin_str", "cores", "memory",
+        "runtime_estimate", "time_limit", "cpu_time_limit", "priority", "queue", "inputs",
+        "status", "submitted_time", "queued_time", "start_time", "end_time", "exit_code", "usage",
+    )
+
     def __init__(self, *, name: str, cmd: Union[str, list[str]], env: Optional[dict[str, str]] = None,
                  cwd: Optional[str] = None,
                  shell=False,
                  stdin: Optional[str] = None, stdout: Optional[str] = None, stderr: Optional[str] = None,
                  stdin_str: Optional[str] = None,
+                 cores: int = 1, memory: Optional[int] = None,
+                 runtime_estimate: Optional[float] = None,
+                 time_limit: Optional[float] = None, cpu_time_limit: Optional[float] = None,
+                 priority: Optional[int] = None, queue: Optional[str] = None, inputs: Optional[list[str]] = None,
                  status: JobStatus = JobStatus.PENDING,
                  exit_code: Optional[int] = None,
                  submitted_time: Optional[datetime] = None, queued_time: Optional[datetime] = None,
                  start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                 usage: Optional[ResourceUsage] = None,
                  ):
         self.name = name
         self.cmd = cmd
@@ -44,16 +113,31 @@ class Job:
         self.stdout = stdout
         self.stderr = stderr
         self.stdin_str = stdin_str
+        self.cores = cores
+        self.memory = memory  # MiB
+        self.runtime_estimate = runtime_estimate  # seconds
+        self.time_limit = time_limit  # wall-clock seconds
+        self.cpu_time_limit = cpu_time_limit  # seconds
+        self.priority = priority  # higher runs first, None for the default of the executor (0)
+        self.queue = queue  # fair-share queue, e.g. the experiment name
+        self.inputs = inputs  # files read by the job, which executors may stage closer to it
         self.status = status
         self.submitted_time = submitted_time
         self.queued_time = queued_time
         self.start_time = start_time
         self.end_time = end_time
         self.exit_code = exit_code
+        self.usage = usage
 
     def __str__(self):
         return self.name
 
+    def copy(self, cls: Optional[type] = None) -> "Job":
+        """
+        Shallow copy of the job, optionally as an instance of a subclass such as an executor specific job.
+        """
+        return (cls or type(self))(**{name: getattr(self, name) for name in Job.__slots__})
+
     def to_json(self) -> dict:
         return {
             "name": self.name,
@@ -65,12 +149,21 @@ class Job:
             "stdout": self.stdout,
             "stderr": self.stderr,
             "stdin_str": self.stdin_str,
+            "cores": self.cores,
+            "memory": self.memory,
+            "runtime_estimate": self.runtime_estimate,
+            "time_limit": self.time_limit,
+            "cpu_time_limit": self.cpu_time_limit,
+            "priority": self.priority,
+            "queue": self.queue,
+            "inputs": self.inputs,
             "status": self.status.value,
             "exit_code": self.exit_code,
             "submitted_time": self.submitted_time.isoformat() if self.submitted_time else None,
             "queued_time": self.queued_time.isoformat() if self.queued_time else None,
             "start_time": self.start_time.isoformat() if self.start_time else None,
-            "end_time": self.end_time.isoformat() if self.end_time else None
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "usage": self.usage.to_json() if self.usage else None,
         }
 
     @classmethod
@@ -85,10 +178,55 @@ class Job:
             stdout=data.get("stdout"),
             stderr=data.get("stderr"),
             stdin_str=data.get("stdin_str"),
-            status=data.get("status", JobStatus.PENDING),
+            cores=data.get("cores", 1),
+            memory=data.get("memory"),
+            runtime_estimate=data.get("runtime_estimate"),
+            time_limit=data.get("time_limit"),
+            cpu_time_limit=data.get("cpu_time_limit"),
+            priority=data.get("priority"),
+            queue=data.get("queue"),
+            inputs=data.get("inputs"),
+            status=JobStatus(data.get("status", JobStatus.PENDING)),
             exit_code=data.get("exit_code"),
             submitted_time=datetime.fromisoformat(data["submitted_time"]) if data.get("submitted_time") else None,
             queued_time=datetime.fromisoformat(data["queued_time"]) if data.get("queued_time") else None,
             start_time=datetime.fromisoformat(data["start_time"]) if data.get("start_time") else None,
-            end_time=datetime.fromisoformat(data["end_time"]) if data.get("end_time") else None
+            end_time=datetime.fromisoformat(data["end_time"]) if data.get("end_time") else None,
+            usage=ResourceUsage.from_json(data["usage"]) if data.get("usage") else None,
+        )
+
+    def to_bytes(self) -> bytes:
+        """
+        Compact binary encoding: a marshalled tuple of the fields, with integer timestamps (microseconds
+        since the epoch) and status codes. About 3x faster and 3x smaller than the JSON round trip; the
+        marshal format used is readable by any Python 3.4+. Like marshal, ``from_bytes`` is only meant
+        for trusted data, such as the queue database of the server, and never for network input.
+        """
+        return marshal.dumps((
+            _CODEC_VERSION, self.name, self.cmd, self.env, self.cwd, self.shell, self.stdin, self.stdout,
+            self.stderr, self.stdin_str, self.cores, self.memory, self.runtime_estimate,
+            self.time_limit, self.cpu_time_limit, self.priority, self.queue, self.inputs,
+            _STATUS_CODES[self.status], self.exit_code,
+            _encode_time(self.submitted_time), _encode_time(self.queued_time),
+            _encode_time(self.start_time), _encode_time(self.end_time),
+            astuple(self.usage) if self.usage else None,
+        ), 4)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        fields = marshal.loads(data)
+        # check the version first, the fields of other versions may not unpack
+        if fields[0] != _CODEC_VERSION:
+            raise ValueError(f"Unsupported job encoding version {fields[0]}")
+        (_, name, cmd, env, cwd, shell, stdin, stdout, stderr, stdin_str, cores, memory, runtime_estimate,
+         time_limit, cpu_time_limit, priority, queue, inputs, status, exit_code,
+         submitted_time, queued_time, start_time, end_time, usage) = fields
+        return cls(
+            name=name, cmd=cmd, env=env, cwd=cwd, shell=shell, stdin=stdin, stdout=stdout, stderr=stderr,
+            stdin_str=stdin_str, cores=cores, memory=memory, runtime_estimate=runtime_estimate,
+            time_limit=time_limit, cpu_time_limit=cpu_time_limit, priority=priority, queue=queue,
+            inputs=inputs, status=_STATUSES[status], exit_code=exit_code,
+            submitted_time=_decode_time(submitted_time), queued_time=_decode_time(queued_time),
+            start_time=_decode_time(start_time), end_time=_decode_time(end_time),
+            usage=ResourceUsage(*usage) if usage else None,
         )
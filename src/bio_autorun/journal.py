@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+import logging
+from queue import Empty, SimpleQueue
+import sqlite3
+import threading
+from typing import Optional
+
+from bio_autorun.job import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+_TIME_FIELDS = {
+    JobStatus.SUBMITTED: "submitted_time",
+    JobStatus.QUEUED: "queued_time",
+    JobStatus.STARTED: "start_time",
+    JobStatus.COMPLETED: "end_time",
+}
+
+
+class JobJournal:
+    """
+    Append-only record of job lifecycle transitions, stored in SQLite (WAL mode).
+
+    Records are queued in memory and written by a background thread in batches of up to ``batch_size``,
+    at least every ``flush_interval`` seconds, so recording a transition never waits on the disk.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: SimpleQueue = SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "name TEXT NOT NULL, status TEXT NOT NULL, time REAL NOT NULL, exit_code INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS events_status_name ON events (status, name)")
+        return conn
+
+    def open(self):
+        # create the database before returning, so that errors surface in the caller
+        self._connect().close()
+        self._writer = threading.Thread(target=self._run, name="job-journal", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._writer.join()
+
+    def record(self, status: JobStatus, job: Job):
+        time = getattr(job, _TIME_FIELDS[status]) if status in _TIME_FIELDS else None
+        time = time or datetime.now(timezone.utc)
+        self._queue.put((job.name, status.value, time.timestamp(), job.exit_code))
+
+    def completed_jobs(self) -> set[str]:
+        """
+        Names of the jobs that completed with exit code 0.
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT DISTINCT name FROM events WHERE status = ? AND exit_code = 0", (JobStatus.COMPLETED.value,)
+            )
+            return {name for name, in rows}
+        finally:
+            conn.close()
+
+    def _run(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            if batch and batch[-1] is self._STOP:
+                batch.pop()
+                stopping = True
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", batch)
+                except sqlite3.Error:
+                    logger.exception(f"Failed to write {len(batch)} records to the job journal {self.path}")
+        conn.close()
@@ -2,13 +2,14 @@ import glob
 import os
 import logging
 import re
-from typing import Iterable, Union
+from typing import Iterable, Optional, Union
 
 import pandas as pd
 
 from bio_autorun.datasets.generic import Dataset
 from bio_autorun.job import Job
 from bio_autorun.msa import MSA
+from bio_autorun.predictor import MakespanReport, RuntimePredictor
 from bio_autorun.task import Task
 
 logger = logging.getLogger(__name__)
@@ -16,13 +17,15 @@ logger = logging.getLogger(__name__)
 
 class MPBootTreeSearchBase(Task):
     def __init__(self, name: str, *, commands: dict[str, str], dataset: Union[Dataset, Iterable[MSA]], output: str,
-                 seeds: list[int], skipped_jobs: list[str] = [], **kwargs):
+                 seeds: list[int], skipped_jobs: list[str] = [], predictor: Optional[RuntimePredictor] = None,
+                 **kwargs):
         super().__init__(name, **kwargs)
         self.commands = commands
         self.dataset = dataset
         self.output = output
         self.seeds = seeds
         self.skipped_jobs = skipped_jobs
+        self.predictor = predictor
 
 
 class MPBootTreeSearch(MPBootTreeSearchBase):
@@ -33,19 +36,21 @@ class MPBootTreeSearch(MPBootTreeSearchBase):
         self.parser.add_argument("--overwrite-check", action="store_true", default=False,
                         help="If set, perform the log overwrite check. False by default.")
 
-    def __call__(self, *args, rerun_incomplete: bool, overwrite_check: bool, **kwargs):
-        with self.executor.acquire():
-            if not os.path.exists(self.output):
-                logger.info(f"Creating output directory: {self.output}")
-                os.makedirs(self.output)
-            for msa in self.dataset:
-                for command_name, command in self.commands.items():
-                    for seed in self.seeds:
-                        job_name = f"{msa.name}_{command_name}_{seed}"
-                        if job_name in self.skipped_jobs:
-                            logger.debug(f"Skipping job {job_name} as it is in the skipped jobs list.")
+    def _jobs(self, rerun_incomplete: bool, overwrite_check: bool):
+        for msa in self.dataset:
+            for command_name, command in self.commands.items():
+                for seed in self.seeds:
+                    job_name = f"{msa.name}_{command_name}_{seed}"
+                    if job_name in self.skipped_jobs:
+                        logger.debug(f"Skipping job {job_name} as it is in the skipped jobs list.")
+                        continue
+                    prefix = f"{self.output}/{job_name}"
+                    if self.executor.journal is not None:
+                        # the journal knows which jobs completed, no need to look at the output files
+                        if self.executor.is_completed(job_name):
+                            logger.debug(f"Job {job_name} already completed according to the journal. Skipping.")
                             continue
-                        prefix = f"{self.output}/{job_name}"
+                    else:
                         if os.path.exists(prefix + ".mpboot"):
                             if overwrite_check and os.path.exists(prefix + ".log"):
                                 # The log might have been overwritten
@@ -65,14 +70,34 @@ class MPBootTreeSearch(MPBootTreeSearchBase):
                             else:
                                 logger.warning(f"Log file for {job_name} already exists. Skipping.")
                                 continue
-                        self.executor.submit(Job(
-                            name=job_name,
-                            cmd=command+[
-                                "-s", msa.path,
-                                "-pre", prefix,
-                                "-seed", str(seed)
-                            ]
-                        ))
+                    yield msa, command_name, Job(
+                        name=job_name,
+                        cmd=command+[
+                            "-s", msa.path,
+                            "-pre", prefix,
+                            "-seed", str(seed)
+                        ],
+                        inputs=[msa.path],
+                    )
+
+    def __call__(self, *args, rerun_incomplete: bool, overwrite_check: bool, **kwargs):
+        report = None
+        jobs = self._jobs(rerun_incomplete, overwrite_check)
+        if self.predictor is not None:
+            # submit the longest jobs first to minimize the makespan
+            jobs = self.predictor.longest_first(jobs)
+            report = MakespanReport(getattr(self.executor.config, "max_workers", 1), jobs)
+            report.attach(self.executor)
+        else:
+            jobs = (job for _, _, job in jobs)
+
+        with self.executor.acquire():
+            if not os.path.exists(self.output):
+                logger.info(f"Creating output directory: {self.output}")
+                os.makedirs(self.output)
+            self.executor.submit_many(jobs)
+        if report is not None:
+            logger.info(report)
 
 
 class MPBootParseLog(MPBootTreeSearchBase):
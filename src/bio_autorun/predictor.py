@@ -0,0 +1,178 @@
+import ast
+import csv
+from datetime import datetime
+import heapq
+import logging
+import statistics
+from typing import Iterable, Optional, TypeVar
+
+from bio_autorun.job import Job, JobStatus
+from bio_autorun.msa import MSA
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def msa_cells(path: str) -> Optional[int]:
+    """
+    Number of cells (taxa x sites) of an alignment, read from the PHYLIP header or by scanning a FASTA file.
+    """
+    try:
+        with open(path, "r") as f:
+            first = f.readline()
+            if not first.startswith(">"):
+                ntaxa, nsites = first.split()[:2]
+                return int(ntaxa) * int(nsites)
+            ntaxa, nsites = 1, 0
+            for line in f:
+                if line.startswith(">"):
+                    ntaxa += 1
+                elif ntaxa == 1:
+                    nsites += len(line.strip())
+            return ntaxa * nsites
+    except (OSError, ValueError):
+        logger.warning(f"Could not read the dimensions of {path}")
+        return None
+
+
+class RuntimePredictor:
+    """
+    Predict the wall-clock time of running a command on an MSA from past runs.
+
+    Known (MSA, command) pairs are predicted by the mean of their past runtimes. Unseen MSAs fall back
+    on their size, scaled by the median runtime per cell observed for the command (or for any command);
+    without any history there is no prediction. All times are in seconds.
+    """
+
+    def __init__(self):
+        self.history: dict[tuple[str, str], list[float]] = {}
+        self._cells: dict[str, Optional[int]] = {}
+        self._rates: dict[Optional[str], Optional[float]] = {}
+
+    def add(self, msa_name: str, command_name: str, runtime: float):
+        self.history.setdefault((msa_name, command_name), []).append(runtime)
+        self._rates.clear()
+
+    def load_analysis_csv(self, csv_path: str, command_name: str, threads: int = 1):
+        """
+        Load the runtimes of a command from a CSV written by MPBootParseLog or TNTParseLog (CPU times in
+        hours), for runs that used ``threads`` threads.
+        """
+        with open(csv_path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                for runtime in ast.literal_eval(row["Runtimes"]):
+                    self.add(row["MSA"], command_name, runtime * 3600 / threads)
+
+    def load_iqtree_log(self, msa_name: str, command_name: str, log_path: str, threads: int = 1):
+        """
+        Load the runtime of a command from an IQ-TREE log: its wall-clock time, or its CPU time divided by
+        ``threads`` for logs that lack it. Logs of runs that were interrupted too early are skipped.
+        """
+        from bio_autorun.iqtree.runtime import JobResultParser
+
+        try:
+            result = JobResultParser().parse(log_path)
+        except AttributeError:
+            # the parser expects the end of the tree search
+            logger.warning(f"Skipping the truncated log {log_path}")
+            return
+        if result.wall_time is not None:
+            self.add(msa_name, command_name, result.wall_time)
+        elif result.cpu_time is not None:
+            self.add(msa_name, command_name, result.cpu_time / threads)
+
+    def _msa_cells(self, msa: MSA) -> Optional[int]:
+        if msa.name not in self._cells:
+            self._cells[msa.name] = msa_cells(msa.path) if msa.path else None
+        return self._cells[msa.name]
+
+    def _rate(self, command_name: Optional[str]) -> Optional[float]:
+        if command_name not in self._rates:
+            rates = []
+            for (msa_name, name), times in self.history.items():
+                cells = self._cells.get(msa_name)
+                if cells and (command_name is None or name == command_name):
+                    rates.append(statistics.mean(times) / cells)
+            self._rates[command_name] = statistics.median(rates) if rates else None
+        return self._rates[command_name]
+
+    def predict(self, msa: MSA, command_name: str) -> Optional[float]:
+        times = self.history.get((msa.name, command_name))
+        if times:
+            return statistics.mean(times)
+        cells = self._msa_cells(msa)
+        if cells is None:
+            return None
+        rate = self._rate(command_name) or self._rate(None)
+        return cells * rate if rate else None
+
+    def learn_dimensions(self, msa_list: Iterable[MSA]):
+        """
+        Read the size of the MSAs with a history, so that unseen MSAs can be predicted from their size.
+        """
+        names = {msa_name for msa_name, _ in self.history}
+        for msa in msa_list:
+            if msa.name in names and msa.name not in self._cells:
+                self._msa_cells(msa)
+                self._rates.clear()
+
+    def longest_first(self, jobs: Iterable[tuple[MSA, str, T]]) -> list[T]:
+        """
+        Order ``(msa, command_name, job)`` triples longest predicted first (LPT) and return the jobs.
+
+        Predictions are stored in ``job.runtime_estimate``. Jobs without a prediction are placed last,
+        largest MSA first, which still gives their relative order when there is no history at all.
+        """
+        jobs = list(jobs)
+        self.learn_dimensions(msa for msa, _, _ in jobs)
+        keys = []
+        for msa, command_name, job in jobs:
+            job.runtime_estimate = self.predict(msa, command_name)
+            if job.runtime_estimate is not None:
+                keys.append((1, job.runtime_estimate))
+            else:
+                keys.append((0, self._msa_cells(msa) or -1))
+        order = sorted(range(len(jobs)), key=keys.__getitem__, reverse=True)
+        return [jobs[i][2] for i in order]
+
+
+def list_schedule_makespan(durations: Iterable[float], workers: int) -> float:
+    """
+    Makespan of greedily assigning the durations, in order, to the least loaded of ``workers`` workers.
+    """
+    loads = [0.0] * workers
+    for duration in durations:
+        heapq.heapreplace(loads, loads[0] + duration)
+    return max(loads)
+
+
+class MakespanReport:
+    """
+    Compare the makespan predicted from ``job.runtime_estimate`` with the one actually observed.
+    """
+
+    def __init__(self, workers: int, jobs: Iterable[Job]):
+        self.workers = workers
+        self.estimates = [job.runtime_estimate for job in jobs if job.runtime_estimate is not None]
+        self.first_start: Optional[datetime] = None
+        self.last_end: Optional[datetime] = None
+
+    def attach(self, executor):
+        executor.event_subscribe(JobStatus.STARTED, self._on_started)
+        executor.event_subscribe(JobStatus.COMPLETED, self._on_completed)
+
+    def _on_started(self, job: Job):
+        if job.start_time and (self.first_start is None or job.start_time < self.first_start):
+            self.first_start = job.start_time
+
+    def _on_completed(self, job: Job):
+        if job.end_time and (self.last_end is None or job.end_time > self.last_end):
+            self.last_end = job.end_time
+
+    def __str__(self):
+        predicted = list_schedule_makespan(self.estimates, self.workers)
+        if self.first_start is None or self.last_end is None:
+            return f"Predicted makespan: {predicted:.0f}s, actual makespan: unknown"
+        actual = (self.last_end - self.first_start).total_seconds()
+        return f"Predicted makespan: {predicted:.0f}s, actual makespan: {actual:.0f}s ({len(self.estimates)} jobs)"
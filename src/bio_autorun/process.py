@@ -0,0 +1,149 @@
+import os
+import subprocess
+import threading
+from typing import Optional
+
+from bio_autorun.job import Job, ResourceUsage
+
+
+def wait_with_usage(proc: subprocess.Popen) -> ResourceUsage:
+    """
+    Wait for the process to exit and reap it with ``os.wait4``, which also returns the resources it consumed.
+    Sets ``proc.returncode`` like ``Popen.wait`` does.
+    """
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return ResourceUsage.from_rusage(rusage)
+
+
+def feed_stdin(proc: subprocess.Popen, data: bytes):
+    """
+    Write ``data`` to the standard input of the process and close it, without waiting for the process.
+    """
+    try:
+        proc.stdin.write(data)
+    except BrokenPipeError:
+        # the process exited or closed its input early
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+_PIPE_CAPACITY = 65536  # default pipe buffer size on Linux
+_CHUNK_SIZE = 65536
+
+
+def _read_tail(path: str, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(max(0, os.fstat(f.fileno()).st_size - size))
+        return f.read()
+
+
+class JobStreams:
+    """
+    Standard streams of a job, to be passed to ``Popen``.
+
+    Files are handed to the child as file descriptors, so it reads and writes them directly and nothing goes
+    through Python. ``stdin_str`` is written to a pipe, from a background thread if it does not fit in the pipe
+    buffer. ``stderr="stdout"`` merges the error stream into the output stream.
+
+    If ``tail_size`` is positive, the last ``tail_size`` bytes of the output and error streams are kept for
+    diagnostics: read back from the file after the job exits, or, for streams that are not redirected to a
+    file, captured through a pipe instead of being discarded.
+    """
+
+    def __init__(self, job: Job, tail_size: int = 0):
+        self.job = job
+        self.tail_size = tail_size
+        self.stdout_tail: Optional[bytes] = None
+        self.stderr_tail: Optional[bytes] = None
+        self._files = []
+        self._threads: list[threading.Thread] = []
+        self._captured: dict[str, bytes] = {}
+
+    def _open(self, path: str, mode: str):
+        f = open(path, mode, buffering=0)
+        self._files.append(f)
+        return f
+
+    def __enter__(self):
+        job = self.job
+        try:
+            if job.stdin:
+                self.stdin = self._open(job.stdin, "rb")
+            elif job.stdin_str is not None:
+                self.stdin = subprocess.PIPE
+            else:
+                self.stdin = subprocess.DEVNULL
+            self.stdout = self._output(job.stdout)
+            if job.stderr == "stdout":
+                self.stderr = subprocess.STDOUT
+            else:
+                self.stderr = self._output(job.stderr)
+        except BaseException:
+            self._close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for thread in self._threads:
+            thread.join()
+        self._close()
+        if self.tail_size > 0 and exc_type is None:
+            self.stdout_tail = self._tail("stdout", self.job.stdout)
+            if self.job.stderr != "stdout":
+                self.stderr_tail = self._tail("stderr", self.job.stderr)
+
+    def _output(self, path: Optional[str]):
+        if path:
+            return self._open(path, "wb")
+        return subprocess.PIPE if self.tail_size > 0 else subprocess.DEVNULL
+
+    def _close(self):
+        for f in self._files:
+            f.close()
+        self._files.clear()
+
+    def _tail(self, name: str, path: Optional[str]) -> Optional[bytes]:
+        if name in self._captured:
+            return self._captured[name]
+        if path:
+            try:
+                return _read_tail(path, self.tail_size)
+            except OSError:
+                return None
+        return None
+
+    @property
+    def popen_kwargs(self) -> dict:
+        return dict(stdin=self.stdin, stdout=self.stdout, stderr=self.stderr)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _capture(self, name: str, pipe):
+        tail = b""
+        with pipe:
+            for chunk in iter(lambda: pipe.read1(_CHUNK_SIZE), b""):
+                tail = (tail + chunk)[-self.tail_size:]
+        self._captured[name] = tail
+
+    def attach(self, proc: subprocess.Popen):
+        """
+        Start feeding and capturing the pipes of a process spawned with ``popen_kwargs``.
+        """
+        if proc.stdin is not None:
+            data = self.job.stdin_str.encode("utf-8")
+            if len(data) <= _PIPE_CAPACITY:
+                feed_stdin(proc, data)
+            else:
+                self._spawn(feed_stdin, proc, data)
+        if proc.stdout is not None:
+            self._spawn(self._capture, "stdout", proc.stdout)
+        if proc.stderr is not None:
+            self._spawn(self._capture, "stderr", proc.stderr)
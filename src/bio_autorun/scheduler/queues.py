@@ -0,0 +1,400 @@
+from collections import deque
+from contextlib import contextmanager
+import heapq
+import itertools
+import sqlite3
+import time
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from bio_autorun.job import Job
+
+DEFAULT_QUEUE = "default"
+MAX_DEFERRED = 1000  # queued jobs passed over at most per take, before locality is given up on
+
+
+class FairShare:
+    """
+    Named queues served in proportion to their weights (stride scheduling), each ordered by priority
+    (higher first) then submission order. Push, pop and remove are O(log n).
+
+    Every queue has a virtual time that advances by 1 / weight for each job it hands out, and the
+    non-empty queue that is furthest behind is served next. A queue that was idle restarts from the
+    current virtual time, so that it cannot claim the share it did not use.
+    """
+
+    def __init__(self, weights: Optional[dict[str, float]] = None):
+        self.weights = weights or {}
+        self._queues: dict[str, list[tuple[int, int]]] = {}  # heap of (-priority, seq) per non-empty queue
+        self._active: list[tuple[float, str]] = []  # heap of (virtual time, name) of the non-empty queues
+        self._times: dict[str, float] = {}
+        self._counts: dict[str, int] = {}
+        self._removed: set[int] = set()  # removed out of turn, dropped when they reach the top of their heap
+        self._clock = 0.0
+        self._counter = itertools.count()
+        self._length = 0
+
+    def next_seq(self) -> int:
+        return next(self._counter)
+
+    def push(self, queue: str, priority: int, seq: int):
+        heap = self._queues.get(queue)
+        if heap is None:
+            heap = self._queues[queue] = []
+            start = max(self._times.get(queue, 0.0), self._clock)
+            self._times[queue] = start
+            heapq.heappush(self._active, (start, queue))
+        heapq.heappush(heap, (-priority, seq))
+        self._counts[queue] = self._counts.get(queue, 0) + 1
+        self._length += 1
+
+    def pop(self) -> tuple[str, int, int]:
+        """
+        Remove the next item, returned as (queue, priority, seq).
+        """
+        while True:
+            clock, queue = heapq.heappop(self._active)
+            if clock != self._times[queue]:
+                # charged by remove() meanwhile
+                heapq.heappush(self._active, (self._times[queue], queue))
+                continue
+            heap = self._queues[queue]
+            while heap and heap[0][1] in self._removed:
+                self._removed.discard(heapq.heappop(heap)[1])
+            if not heap:
+                del self._queues[queue]
+                continue
+            self._clock = clock
+            priority, seq = heapq.heappop(heap)
+            self._times[queue] = clock + 1 / self.weights.get(queue, 1.0)
+            if heap:
+                heapq.heappush(self._active, (self._times[queue], queue))
+            else:
+                del self._queues[queue]
+            self._counts[queue] -= 1
+            self._length -= 1
+            return queue, -priority, seq
+
+    def remove(self, queue: str, seq: int, charge: bool = True):
+        """
+        Remove an item out of turn, charging its queue as if it had been popped unless ``charge`` is False.
+        """
+        self._removed.add(seq)
+        if charge:
+            self._times[queue] += 1 / self.weights.get(queue, 1.0)
+        self._counts[queue] -= 1
+        self._length -= 1
+
+    def swap(self, item: tuple[str, int, int], seq: int):
+        """
+        Hand out ``seq``, of the same queue and priority as the popped ``item``, in place of it: the item
+        is put back where it was, without refunding its queue.
+        """
+        queue, priority, popped = item
+        heapq.heappush(self._queues[queue], (-priority, popped))
+        self._removed.add(seq)
+
+    def restore(self, items: list[tuple[str, int, int]]):
+        """
+        Put back items that were popped but not handed out, as (queue, priority, seq), refunding what
+        their queues were charged for them.
+        """
+        if not items:
+            return
+        for queue, priority, seq in items:
+            heapq.heappush(self._queues.setdefault(queue, []), (-priority, seq))
+            self._times[queue] -= 1 / self.weights.get(queue, 1.0)
+            self._counts[queue] += 1
+            self._length += 1
+        self._active = [(self._times[queue], queue) for queue in self._queues]
+        heapq.heapify(self._active)
+        # the clock is never ahead of the queues it serves
+        self._clock = min(self._clock, self._active[0][0])
+
+    def depths(self) -> dict[str, int]:
+        """
+        Number of items per queue, including the queues that have been emptied.
+        """
+        return dict(self._counts)
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class _Entry(NamedTuple):
+    name: str
+    queue: str
+    priority: int
+    item: Any  # the job, or None for the queues that load it back
+    dataset: Optional[str]
+    enqueued: float  # time.monotonic()
+
+
+def dataset_of(job: Job) -> Optional[str]:
+    """
+    Data a job is placed by: its first input file, usually the alignment.
+    """
+    return job.inputs[0] if job.inputs else None
+
+
+class JobQueue:
+    """
+    Jobs waiting for a worker, handed out by priority and fair share between the queues named by
+    ``Job.queue``, see ``FairShare``. Taken jobs are leased: ``ack`` drops them for good once they have
+    finished, ``nack`` puts them back where they were.
+
+    Queued jobs are also indexed by dataset (``dataset_of``), so that ``take`` can give a worker the
+    jobs whose data it already holds, among those tied for the next turn, and hold back the jobs whose
+    data another worker holds.
+    """
+
+    def __init__(self, weights: Optional[dict[str, float]] = None):
+        self._order = FairShare(weights)
+        self._entries: dict[int, _Entry] = {}  # queued jobs by seq
+        # seqs of the queued jobs by (dataset, queue, priority), may include taken ones
+        self._datasets: dict[tuple[str, str, int], deque[int]] = {}
+        self._queued: dict[str, int] = {}  # seqs of the queued jobs by name
+        # position in the queue of the leased jobs, by name
+        self._leased: dict[str, tuple[str, int, int]] = {}
+
+    def _push(self, name: str, queue: str, priority: int, seq: int, item: Any, dataset: Optional[str]):
+        self._entries[seq] = _Entry(name, queue, priority, item, dataset, time.monotonic())
+        self._queued[name] = seq
+        self._order.push(queue, priority, seq)
+        if dataset is not None:
+            self._datasets.setdefault((dataset, queue, priority), deque()).append(seq)
+
+    def put(self, jobs: list[Job]):
+        raise NotImplementedError
+
+    def take(self, limit: int, prefer: Iterable[str] = (),
+             defer: Optional[Callable[[str, float], bool]] = None) -> list[Job]:
+        """
+        Remove and return up to ``limit`` jobs, without waiting.
+
+        Jobs come in the fair-share order, passing over those for which ``defer(dataset, enqueued)`` is
+        true: they stay queued for a worker that holds their data. Locality never overrides that order:
+        a job of the ``prefer`` datasets is only taken in place of the next one when it is of the same
+        queue and priority.
+        """
+        jobs = []
+        prefer = list(prefer)
+        while len(jobs) < limit:
+            picked = self._pick(limit - len(jobs), prefer, defer)
+            if not picked:
+                break
+            for seq, entry, job in self._load(picked):
+                self._leased[job.name] = (entry.queue, entry.priority, seq)
+                jobs.append(job)
+        return jobs
+
+    def _pick(self, limit: int, prefer: list[str], defer) -> list[tuple[int, _Entry]]:
+        picked = []
+        preferred = set(prefer)
+        deferred = []
+        while self._order and len(picked) < limit and len(deferred) < MAX_DEFERRED:
+            item = self._order.pop()
+            queue, priority, seq = item
+            entry = self._entries[seq]
+            if entry.dataset not in preferred:
+                local = self._local(queue, priority, prefer) if prefer else None
+                if local is not None:
+                    # tied with the next job, a job whose data the worker holds goes in its place
+                    self._order.swap(item, local)
+                    seq, entry = local, self._entries[local]
+                elif defer is not None and entry.dataset is not None and defer(entry.dataset, entry.enqueued):
+                    deferred.append(item)
+                    continue
+            del self._entries[seq]
+            self._taken(seq, entry)
+            if entry.dataset is not None:
+                # jobs of a dataset usually leave in the order they came, keep the index from growing
+                key = (entry.dataset, queue, priority)
+                seqs = self._datasets[key]
+                if seqs[0] == seq:
+                    seqs.popleft()
+                    if not seqs:
+                        del self._datasets[key]
+            picked.append((seq, entry))
+        # passed over for their data, not served: they keep their turn
+        self._order.restore(deferred)
+        return picked
+
+    def _local(self, queue: str, priority: int, prefer: list[str]) -> Optional[int]:
+        """
+        The first queued job of the ``prefer`` datasets with the given queue and priority, if any.
+        """
+        for dataset in prefer:
+            key = (dataset, queue, priority)
+            seqs = self._datasets.get(key)
+            while seqs and seqs[0] not in self._entries:
+                seqs.popleft()
+            if seqs:
+                return seqs[0]
+            if seqs is not None:
+                del self._datasets[key]
+        return None
+
+    def _taken(self, seq: int, entry: _Entry):
+        if self._queued.get(entry.name) == seq:
+            del self._queued[entry.name]
+
+    def discard(self, name: str):
+        """
+        Drop a queued job without handing it out, e.g. when a worker whose lease had expired completed
+        it after all. The database row of a persistent queue is left to ``ack``.
+        """
+        seq = self._queued.pop(name, None)
+        entry = self._entries.pop(seq, None) if seq is not None else None
+        if entry is not None:
+            self._order.remove(entry.queue, seq, charge=False)
+
+    def _load(self, picked: list[tuple[int, _Entry]]) -> Iterator[tuple[int, _Entry, Job]]:
+        """
+        The jobs of the picked entries, skipping those that no longer exist.
+        """
+        for seq, entry in picked:
+            yield seq, entry, entry.item
+
+    def ack(self, names: Iterable[str]):
+        raise NotImplementedError
+
+    def nack(self, jobs: list[Job]):
+        unknown = []
+        for job in jobs:
+            leased = self._leased.pop(job.name, None)
+            if leased is None:
+                # acknowledged meanwhile, it is queued again as a new job
+                unknown.append(job)
+                continue
+            queue, priority, seq = leased
+            self._push(job.name, queue, priority, seq, job, dataset_of(job))
+        if unknown:
+            self.put(unknown)
+
+    def flush(self):
+        """
+        Persist the acknowledgements made so far, for queues that batch them.
+        """
+        pass
+
+    def depths(self) -> dict[str, int]:
+        return self._order.depths()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def close(self):
+        pass
+
+
+class MemoryQueue(JobQueue):
+    def put(self, jobs: list[Job]):
+        for job in jobs:
+            self._push(job.name, job.queue or DEFAULT_QUEUE, job.priority or 0, self._order.next_seq(), job,
+                       dataset_of(job))
+
+    def ack(self, names: Iterable[str]):
+        for name in names:
+            self._leased.pop(name, None)
+
+
+class SqliteQueue(JobQueue):
+    """
+    Queue stored in SQLite (WAL mode), which survives restarts of the server: every job that was not
+    acknowledged is queued again when it is reopened, in its original order.
+
+    Only the ordering keys of the queued jobs are kept in memory, and their encoded data is read back
+    by primary key when they are taken. Jobs are inserted one batch per transaction, and acknowledged
+    jobs are deleted in batches on ``flush``: after a crash, jobs that completed since the last flush
+    are run again.
+    """
+
+    def __init__(self, path: str, weights: Optional[dict[str, float]] = None, ack_batch: int = 1000):
+        super().__init__(weights)
+        self.path = path
+        self.ack_batch = ack_batch
+        # used from the event loop thread of the server only
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, queue TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, data BLOB NOT NULL, dataset TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "dataset" not in columns:
+            # written before jobs were placed by dataset
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN dataset TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name)")
+        # row ids increase, so they double as the submission order
+        for row_id, name, queue, priority, dataset in self._conn.execute(
+                "SELECT id, name, queue, priority, dataset FROM jobs ORDER BY id"):
+            self._push(name, queue, priority, row_id, None, dataset)
+        self._acked: list[tuple[int]] = []
+        last, = self._conn.execute("SELECT MAX(id) FROM jobs").fetchone()
+        self._ids = itertools.count((last or 0) + 1)
+
+    def put(self, jobs: list[Job]):
+        rows = [
+            (next(self._ids), job.name, job.queue or DEFAULT_QUEUE, job.priority or 0, job.to_bytes(), dataset_of(job))
+            for job in jobs
+        ]
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO jobs (id, name, queue, priority, data, dataset) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        for row_id, name, queue, priority, _, dataset in rows:
+            self._push(name, queue, priority, row_id, None, dataset)
+
+    def _load(self, picked: list[tuple[int, _Entry]]) -> Iterator[tuple[int, _Entry, Job]]:
+        # requeued jobs are kept as objects, the others are read back from the database
+        ids = [seq for seq, entry in picked if entry.item is None]
+        data = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            query = f"SELECT id, data FROM jobs WHERE id IN ({','.join('?' * len(chunk))})"
+            data.update(self._conn.execute(query, chunk))
+        for seq, entry in picked:
+            job = entry.item
+            if job is None:
+                if seq not in data:
+                    # acknowledged by name after a restart
+                    continue
+                job = Job.from_bytes(data[seq])
+            yield seq, entry, job
+
+    def ack(self, names: Iterable[str]):
+        other = []
+        for name in names:
+            entry = self._leased.pop(name, None)
+            if entry is None:
+                other.append((name,))
+            else:
+                self._acked.append((entry[2],))
+        if other:
+            with self._transaction():
+                # jobs completed by the workers of a previous run of the server must not run again
+                self._conn.executemany("DELETE FROM jobs WHERE name = ?", other)
+        if len(self._acked) >= self.ack_batch:
+            self.flush()
+
+    def flush(self):
+        if self._acked:
+            with self._transaction():
+                self._conn.executemany("DELETE FROM jobs WHERE id = ?", self._acked)
+            self._acked.clear()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
@@ -1,63 +1,502 @@
+import argparse
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from functools import wraps
 import json
 import logging
-from queue import SimpleQueue
-import threading
+import math
+import time
+from typing import Optional
 
-from flask import Flask, request
+from aiohttp import web
 
 from bio_autorun.job import Job, JobStatus
+from bio_autorun.scheduler.metrics import Counter, Gauge, Histogram, Registry
+from bio_autorun.scheduler.queues import DEFAULT_QUEUE, JobQueue, MemoryQueue, SqliteQueue, dataset_of
 
 logger = logging.getLogger(__name__)
-app = Flask(__name__)
-q: SimpleQueue[Job] = SimpleQueue()
 API_KEY = "abc123"  # Change this to your actual secret key
-stop = threading.Event()
+MAX_LEASE = 1000
+MAX_REQUEST_SIZE = 256 * 1024 * 1024
+POLL_TIMEOUT = 30.0  # seconds a lease request is held open before answering 204 No Content
+LEASE_TIMEOUT = 120.0  # seconds without a heartbeat before a leased job is requeued
+MAX_ATTEMPTS = 3  # leases of a job before it is given up
+EXPIRY_INTERVAL = 1.0  # seconds between two scans for expired leases
+LOCALITY_DELAY = 10.0  # seconds a job is kept for the workers that hold its dataset before any worker gets it
+LOCALITY_RETRY = 1.0  # seconds between two attempts of a lease request that only found jobs kept for others
 
 
-def require_api_key(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        key = request.headers.get('X-API-KEY')
-        if key != API_KEY:
-            return {"error": "Unauthorized"}, 401
-        return f(*args, **kwargs)
-    return decorated
+@dataclass
+class Lease:
+    job: Job
+    worker: str
+    deadline: float  # time.monotonic(), infinite for the leases that never expire
 
 
-@app.route('/add_job', methods=['POST'])
-@require_api_key
-def add_job():
-    body = request.get_json()
+class Scheduler:
+    """
+    Queue and lease bookkeeping of the server. Everything runs on the event loop, so nothing is locked;
+    idle workers waiting for jobs are parked on a condition rather than holding a thread each.
+
+    Jobs are placed by data locality (delay scheduling): workers report the datasets they hold, and get
+    the jobs of those datasets first among the jobs of the same queue and priority, so that locality
+    never overrides fair share nor priority. A job whose dataset an active worker holds is kept for that worker
+    for up to ``locality_delay`` seconds after it was queued, then it goes to whichever worker asks.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, locality_delay: float = LOCALITY_DELAY):
+        self.queue = queue if queue is not None else MemoryQueue()
+        self.locality_delay = locality_delay
+        self.leases: dict[str, Lease] = {}  # in-flight jobs, by name
+        self.attempts: dict[str, int] = {}
+        self.results: dict[str, Job] = {}  # completed jobs, by name
+        self.stopped = False
+        self._changed: Optional[asyncio.Condition] = None
+        self._waiting = 0  # lease requests waiting for jobs
+        self._last_seen: dict[str, float] = {}  # time.monotonic() of the last request of each worker
+        self._held: dict[str, set[str]] = {}  # datasets held by each worker
+        self._holders: dict[str, set[str]] = {}  # workers holding each dataset
+
+        self.metrics = Registry()
+        self._enqueued = self.metrics.register(Counter(
+            "autorun_jobs_enqueued_total", "Jobs added to the queue, requeued ones included.", ["queue"]))
+        self._dequeued = self.metrics.register(Counter(
+            "autorun_jobs_dequeued_total", "Jobs leased to workers.", ["queue"]))
+        self._placed = self.metrics.register(Counter(
+            "autorun_jobs_placed_total",
+            "Jobs leased to workers, by whether the worker held their dataset (local), another active "
+            "worker did (remote), or none did (none).", ["locality"]))
+        self._completed = self.metrics.register(Counter(
+            "autorun_jobs_completed_total", "Jobs reported by workers, by outcome.", ["queue", "result"]))
+        self._expired = self.metrics.register(Counter(
+            "autorun_leases_expired_total", "Leases that expired, by what happened to the job.", ["action"]))
+        self.metrics.register(Gauge(
+            "autorun_queue_depth", "Jobs waiting in each queue.",
+            lambda: {(queue,): depth for queue, depth in self.queue.depths().items()}, ["queue"]))
+        self.metrics.register(Gauge("autorun_jobs_in_flight", "Jobs leased to workers.", lambda: len(self.leases)))
+        self.metrics.register(Gauge(
+            "autorun_workers_active", f"Workers seen in the last {LEASE_TIMEOUT:g}s.", self._active_workers))
+        self.metrics.register(Gauge(
+            "autorun_lease_requests_waiting", "Lease requests waiting for jobs.", lambda: self._waiting))
+        self._lease_wait = self.metrics.register(Histogram(
+            "autorun_job_lease_wait_seconds", "Time from queued to leased.", ["queue"]))
+        self._start_wait = self.metrics.register(Histogram(
+            "autorun_job_wait_seconds", "Time from queued to started, as reported by the workers.", ["queue"]))
+        self._runtime = self.metrics.register(Histogram(
+            "autorun_job_runtime_seconds", "Time from started to ended, as reported by the workers.", ["queue"]))
+        self.request_latency = self.metrics.register(Histogram(
+            "autorun_request_duration_seconds", "Time to answer requests, long-polls included.", ["endpoint"]))
+
+    def _active_workers(self) -> int:
+        # read when metrics are scraped, so it must not change anything
+        horizon = time.monotonic() - LEASE_TIMEOUT
+        return sum(1 for seen in self._last_seen.values() if seen >= horizon)
+
+    def forget_idle_workers(self):
+        """
+        Drop the workers not seen for ``LEASE_TIMEOUT`` seconds, with the datasets they held.
+        """
+        horizon = time.monotonic() - LEASE_TIMEOUT
+        for worker in [worker for worker, seen in self._last_seen.items() if seen < horizon]:
+            del self._last_seen[worker]
+            self.hold(worker, ())
+
+    def seen(self, worker: str):
+        self._last_seen[worker] = time.monotonic()
+
+    def hold(self, worker: str, datasets):
+        """
+        Record the datasets a worker holds, replacing what it reported before.
+        """
+        datasets = set(datasets)
+        held = self._held.pop(worker, set())
+        for dataset in held - datasets:
+            holders = self._holders[dataset]
+            holders.discard(worker)
+            if not holders:
+                del self._holders[dataset]
+        for dataset in datasets - held:
+            self._holders.setdefault(dataset, set()).add(worker)
+        if datasets:
+            self._held[worker] = datasets
+
+    def _held_elsewhere(self, worker: str, dataset: str) -> bool:
+        """
+        Whether an active worker other than ``worker`` holds ``dataset``.
+        """
+        horizon = time.monotonic() - LEASE_TIMEOUT
+        return any(
+            holder != worker and self._last_seen.get(holder, 0) >= horizon
+            for holder in self._holders.get(dataset, ())
+        )
+
+    async def start(self):
+        self._changed = asyncio.Condition()
+
+    async def put(self, jobs: list[Job]):
+        now = datetime.now(timezone.utc)
+        for job in jobs:
+            job.status = JobStatus.QUEUED
+            job.queued_time = now
+            self._enqueued.inc(queue=job.queue or DEFAULT_QUEUE)
+        self.queue.put(jobs)
+        async with self._changed:
+            self._changed.notify(len(jobs))
+
+    async def stop(self):
+        self.stopped = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    @property
+    def drained(self) -> bool:
+        """
+        Whether the server is stopping and has no jobs left, queued or in flight.
+        """
+        return self.stopped and not len(self.queue) and not self.leases
+
+    async def lease(self, worker: str, limit: int, timeout: float,
+                    datasets: Optional[list[str]] = None, expires: bool = True) -> Optional[list[Job]]:
+        """
+        Wait up to ``timeout`` seconds for jobs and lease up to ``limit`` of them to ``worker``, those of
+        the ``datasets`` it holds first when they are tied for their turn. Returns None on timeout, and an
+        empty list once the server is drained. Unless ``expires``, the leases are never requeued.
+        """
+        self.seen(worker)
+        if datasets is not None:
+            self.hold(worker, datasets)
+        held = self._held.get(worker, ())
+        end = time.monotonic() + timeout
+
+        def defer(dataset: str, enqueued: float) -> bool:
+            return enqueued > time.monotonic() - self.locality_delay and self._held_elsewhere(worker, dataset)
+
+        self._waiting += 1
+        try:
+            while True:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: len(self.queue) or self.drained),
+                                           end - time.monotonic())
+                jobs = self.queue.take(limit, held, defer)
+                if jobs or self.drained:
+                    break
+                # every queued job is kept for another worker, until its delay runs out
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                await asyncio.sleep(min(LOCALITY_RETRY, remaining))
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiting -= 1
+        deadline = time.monotonic() + LEASE_TIMEOUT if expires else math.inf
+        now = datetime.now(timezone.utc)
+        for job in jobs:
+            queue = job.queue or DEFAULT_QUEUE
+            self._dequeued.inc(queue=queue)
+            dataset = dataset_of(job)
+            if dataset is None:
+                self._placed.inc(locality="none")
+            elif dataset in held:
+                self._placed.inc(locality="local")
+            else:
+                self._placed.inc(locality="remote" if self._held_elsewhere(worker, dataset) else "none")
+            if job.queued_time is not None:
+                self._lease_wait.observe((now - job.queued_time).total_seconds(), queue=queue)
+            self.leases[job.name] = Lease(job, worker, deadline)
+            self.attempts[job.name] = self.attempts.get(job.name, 0) + 1
+        # the worker fetches the data of the jobs it got, send it the other jobs of those datasets
+        fetched = {dataset_of(job) for job in jobs} - {None} - set(held)
+        if fetched:
+            self.hold(worker, set(held) | fetched)
+        return jobs
+
+    def heartbeat(self, worker: str, names: list[str]) -> list[str]:
+        self.seen(worker)
+        deadline = time.monotonic() + LEASE_TIMEOUT
+        lost = []
+        for name in names:
+            lease = self.leases.get(name)
+            if lease is None or lease.worker != worker:
+                lost.append(name)
+            elif lease.deadline != math.inf:
+                lease.deadline = deadline
+        return lost
+
+    async def complete(self, worker: str, job: Job) -> bool:
+        """
+        Record the result of a job. Returns False if it was already completed.
+        """
+        self.seen(worker)
+        if job.name in self.results:
+            return False
+        # the first result wins, even from a worker whose lease expired: the lease of the worker that
+        # runs the job again is dropped with it, that worker is told so by its next heartbeat, and so is
+        # the job if it was requeued and is waiting for a worker
+        self.leases.pop(job.name, None)
+        self.queue.discard(job.name)
+        self.queue.ack([job.name])
+        job.status = JobStatus.COMPLETED
+        self.results[job.name] = job
+        queue = job.queue or DEFAULT_QUEUE
+        self._completed.inc(queue=queue, result="success" if job.exit_code == 0 else "failure")
+        if job.start_time is not None:
+            if job.queued_time is not None:
+                self._start_wait.observe((job.start_time - job.queued_time).total_seconds(), queue=queue)
+            if job.end_time is not None:
+                self._runtime.observe((job.end_time - job.start_time).total_seconds(), queue=queue)
+        if self.drained:
+            # wake the workers waiting for the last in-flight jobs
+            await self._notify_all()
+        return True
+
+    async def _notify_all(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def requeue_expired(self):
+        """
+        Put back in the queue the jobs whose lease has expired.
+        """
+        now = time.monotonic()
+        expired = [lease for lease in self.leases.values() if lease.deadline < now]
+        requeued, abandoned = [], []
+        for lease in expired:
+            job = lease.job
+            del self.leases[job.name]
+            if self.attempts[job.name] >= MAX_ATTEMPTS:
+                logger.error(f"Lease of job {job.name} on {lease.worker} expired, giving up after {MAX_ATTEMPTS} attempts")
+                abandoned.append(job.name)
+                self._expired.inc(action="abandoned")
+                continue
+            logger.warning(f"Lease of job {job.name} on {lease.worker} expired, requeueing it")
+            job.status = JobStatus.QUEUED
+            job.queued_time = datetime.now(timezone.utc)
+            requeued.append(job)
+            self._expired.inc(action="requeued")
+            self._enqueued.inc(queue=job.queue or DEFAULT_QUEUE)
+        if abandoned:
+            self.queue.ack(abandoned)
+        if requeued:
+            self.queue.nack(requeued)
+            async with self._changed:
+                self._changed.notify(len(requeued))
+        elif expired and self.drained:
+            await self._notify_all()
+
+    async def expire_leases(self):
+        while True:
+            await asyncio.sleep(EXPIRY_INTERVAL)
+            await self.requeue_expired()
+            self.forget_idle_workers()
+            self.queue.flush()
+
+
+routes = web.RouteTableDef()
+
+
+@web.middleware
+async def measure_latency(request: web.Request, handler):
+    begin = time.perf_counter()
     try:
-        job = Job.from_json(body)
-        job.status = JobStatus.QUEUED
-        job.queued_time = datetime.now(timezone.utc)
+        return await handler(request)
+    finally:
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else "unmatched"
+        request.app["scheduler"].request_latency.observe(time.perf_counter() - begin, endpoint=endpoint)
+
+
+@web.middleware
+async def require_api_key(request: web.Request, handler):
+    # left open for Prometheus scrapers, it only exposes counts
+    if request.path == "/metrics":
+        return await handler(request)
+    if request.headers.get('X-API-KEY') != request.app["api_key"]:
+        return web.json_response({"error": "Unauthorized"}, status=401)
+    return await handler(request)
+
+
+def _scheduler(request: web.Request) -> Scheduler:
+    return request.app["scheduler"]
+
+
+def _worker_id(request: web.Request) -> str:
+    return request.headers.get('X-WORKER-ID', request.remote or "unknown")
+
+
+@routes.post('/add_job')
+async def add_job(request: web.Request):
+    try:
+        job = Job.from_json(await request.json())
     except Exception as e:
-        logger.error(f"Error adding job: {body}")
-        return {"error": str(e)}, 400
-    q.put(job)
+        logger.error(f"Error adding job: {e}")
+        return web.json_response({"error": str(e)}, status=400)
+    await _scheduler(request).put([job])
     logger.info(f"Job added: {job.name}")
-    return {"message": "Job added successfully"}, 200
+    return web.json_response({"message": "Job added successfully"})
+
+
+@routes.post('/add_jobs')
+async def add_jobs(request: web.Request):
+    """
+    Queue many jobs at once, given as a JSON list of jobs. The binary encoding of jobs is not accepted
+    here: it relies on marshal, which must not read untrusted data.
+    """
+    try:
+        data = await request.json()
+        if not isinstance(data, list):
+            raise ValueError("expected a list of jobs")
+        jobs = [Job.from_json(job) for job in data]
+    except Exception as e:
+        logger.error(f"Error adding jobs: {e}")
+        return web.json_response({"error": str(e)}, status=400)
+    await _scheduler(request).put(jobs)
+    logger.info(f"{len(jobs)} jobs added")
+    return web.json_response({"message": f"{len(jobs)} jobs added successfully"})
+
+
+@routes.post('/get_job')
+async def get_job(request: web.Request):
+    """
+    Lease a single job, for the clients that predate /get_jobs. They do not send heartbeats, so this
+    lease never expires, and the job of a worker that died stays leased.
+    """
+    scheduler = _scheduler(request)
+    jobs = await scheduler.lease(_worker_id(request), 1, POLL_TIMEOUT, expires=False)
+    if jobs is None:
+        return web.Response(status=204)
+    if not jobs:
+        return web.json_response({"error": "No jobs left"}, status=500)
+    return web.json_response(jobs[0].to_json())
+
+
+@routes.post('/get_jobs')
+async def get_jobs(request: web.Request):
+    """
+    Lease up to ``max`` jobs at once. Waits up to ``POLL_TIMEOUT`` seconds for at least one job to be
+    available, then returns every queued job up to ``max`` without waiting for more. Answers 204 No
+    Content if no job came in time, and an empty list when the server is stopping and has no jobs
+    left, queued or in flight.
+
+    The body may list the datasets (first input files) the worker holds, as ``{"datasets": [paths]}``:
+    it then gets the jobs of those datasets first, within fair share and priority, see ``Scheduler``.
+
+    The jobs are leased to the worker: unless it reports them with /complete_job, or keeps them alive
+    with /heartbeat, they are requeued after ``LEASE_TIMEOUT`` seconds.
+    """
+    try:
+        limit = int(request.query.get("max", 1))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return web.json_response({"error": "max must be positive"}, status=400)
+    datasets = None
+    body = await request.read()
+    if body.strip():
+        try:
+            datasets = json.loads(body).get("datasets")
+            if datasets is not None and not all(isinstance(dataset, str) for dataset in datasets):
+                raise ValueError
+        except (ValueError, AttributeError, TypeError):
+            return web.json_response({"error": 'expected a JSON object such as {"datasets": [paths]}'}, status=400)
+    jobs = await _scheduler(request).lease(_worker_id(request), min(limit, MAX_LEASE), POLL_TIMEOUT, datasets)
+    if jobs is None:
+        return web.Response(status=204)
+    return web.json_response([job.to_json() for job in jobs])
+
+
+@routes.post('/heartbeat')
+async def heartbeat(request: web.Request):
+    """
+    Extend the leases of the jobs a worker holds, given as ``{"jobs": [names]}``. Returns the names
+    that are no longer leased to it, which the worker should drop.
+    """
+    try:
+        names = json.loads(await request.read())["jobs"]
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"error": 'expected a JSON object such as {"jobs": [names]}'}, status=400)
+    lost = _scheduler(request).heartbeat(_worker_id(request), names)
+    return web.json_response({"lost": lost})
 
 
-@app.route('/get_job', methods=['POST'])
-@require_api_key
-def get_job():
+@routes.post('/complete_job')
+async def complete_job(request: web.Request):
+    """
+    Report the result of a leased job, as its JSON encoding with exit_code, end_time and usage set.
+    """
     try:
-        if stop.is_set():
-            job = q.get_nowait()
-        else:
-            job = q.get()
+        job = Job.from_json(await request.json())
     except Exception as e:
-        logger.error(f"Error getting job: {e}")
-        return {"error": str(e)}, 500
-    return json.dumps(job.to_json()), 200
+        logger.error(f"Error completing job: {e}")
+        return web.json_response({"error": str(e)}, status=400)
+    if not await _scheduler(request).complete(_worker_id(request), job):
+        return web.json_response({"message": "Job already completed"})
+    logger.info(f"Job completed: {job.name} with exit code {job.exit_code}")
+    return web.json_response({"message": "Job completed successfully"})
+
+
+@routes.get('/metrics')
+async def metrics(request: web.Request):
+    """
+    Counters, gauges and histograms of the server in the Prometheus text format. Enqueue and dequeue
+    rates are the rate() of the *_total counters.
+    """
+    return web.Response(text=_scheduler(request).metrics.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+@routes.post('/stop_server')
+async def stop_server(request: web.Request):
+    await _scheduler(request).stop()
+    return web.json_response({"message": "Server stopping"})
+
+
+async def _background(app: web.Application):
+    scheduler: Scheduler = app["scheduler"]
+    await scheduler.start()
+    task = asyncio.ensure_future(scheduler.expire_leases())
+    yield
+    task.cancel()
+    scheduler.queue.close()
+
+
+def create_app(api_key: str = API_KEY, scheduler: Optional[Scheduler] = None) -> web.Application:
+    # large enough for a full batch of jobs from SchedulerExecutor
+    app = web.Application(middlewares=[measure_latency, require_api_key], client_max_size=MAX_REQUEST_SIZE)
+    app["api_key"] = api_key
+    app["scheduler"] = scheduler or Scheduler()
+    app.add_routes(routes)
+    app.cleanup_ctx.append(_background)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve jobs to bio_autorun scheduler workers.")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--api-key", type=str, default=API_KEY)
+    parser.add_argument("--queue-db", type=str, default=None,
+                        help="SQLite database to keep the queue in, so that it survives restarts (default: in memory).")
+    parser.add_argument("--queue-weight", action="append", default=[], metavar="NAME=WEIGHT",
+                        help="Share of the workers given to a queue relative to the others (default: 1). "
+                             "Can be specified multiple times.")
+    parser.add_argument("--locality-delay", type=float, default=LOCALITY_DELAY,
+                        help="Seconds a job waits for a worker that holds its dataset before it goes to any "
+                             f"worker (default: {LOCALITY_DELAY:g}, 0 disables locality).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    weights = {}
+    for arg in args.queue_weight:
+        name, _, weight = arg.rpartition("=")
+        weights[name] = float(weight)
+    queue = SqliteQueue(args.queue_db, weights) if args.queue_db else MemoryQueue(weights)
+    scheduler = Scheduler(queue, args.locality_delay)
+    if len(scheduler.queue):
+        logger.info(f"Resuming with {len(scheduler.queue)} queued jobs from {args.queue_db}")
+    web.run_app(create_app(args.api_key, scheduler), host=args.host, port=args.port, access_log=None)
 
 
-@app.route('/stop_server', methods=['POST'])
-@require_api_key
-def stop_server():
-    stop.set()
-    return {"message": "Server stopping"}, 200
+if __name__ == "__main__":
+    main()
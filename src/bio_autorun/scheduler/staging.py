@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import os
+import re
+import shlex
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from bio_autorun.job import Job
+
+logger = logging.getLogger(__name__)
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _replace_word(cmd: str, path: str, local: str) -> str:
+    """
+    Replace ``path`` in a shell command where it is a whole word, bare or quoted, and not part of a longer one.
+    """
+    pattern = r"(?<![^\s;|&<>])(['\"]?)" + re.escape(path) + r"\1(?![^\s;|&<>])"
+    return re.sub(pattern, lambda match: shlex.quote(local), cmd)
+
+
+class StagingCache:
+    """
+    Node-local copies of job input files, stored by content hash under ``root`` as ``<sha256>/<file name>``,
+    so that the same alignment read by many jobs, or found under several paths, is copied only once.
+    Copies keep the original file name, hard linked when a content was found under several names, since
+    tools guess the format from the extension.
+
+    A file is hashed while it is copied, so the shared filesystem is read once per file and then only
+    stat'ed: a path whose size and modification time did not change maps to the same copy. The cache is
+    kept under ``max_bytes`` by evicting the least recently used copies that no running job uses.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._known: dict[tuple[str, int, int], str] = {}  # (path, size, mtime) -> digest
+        self._sizes: dict[str, int] = {}  # digest -> size, in least recently used first order
+        self._pins: dict[str, int] = {}  # digest -> number of running jobs using it
+        self._total = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """
+        Adopt the copies left by a previous worker on this node, oldest first.
+        """
+        entries = []
+        for digest in os.listdir(self.root):
+            directory = os.path.join(self.root, digest)
+            if digest.startswith(".") or not os.path.isdir(directory):
+                continue
+            names = os.listdir(directory)
+            if not names:
+                continue
+            # the other names are hard links to the same data
+            stat = os.stat(os.path.join(directory, names[0]))
+            entries.append((stat.st_mtime, digest, stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._sizes[digest] = size
+            self._total += size
+
+    def _copy(self, path: str) -> str:
+        """
+        Copy ``path`` into the cache, returning its digest.
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".staging-")
+        try:
+            with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                while chunk := src.read(_CHUNK_SIZE):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            key = digest.hexdigest()
+            directory = os.path.join(self.root, key)
+            os.makedirs(directory, exist_ok=True)
+            if os.listdir(directory):
+                # the content is already cached under another path, ``_link`` gives it this name
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, os.path.join(directory, os.path.basename(path)))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def stage(self, path: str) -> Optional[str]:
+        """
+        Local copy of ``path``, pinned until ``release``; None if the file cannot be cached.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.warning(f"Cannot stage {path}: {e}")
+            return None
+        if stat.st_size > self.max_bytes:
+            return None
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._known.get(key)
+            hit = digest is not None and digest in self._sizes
+            if hit:
+                self._pin(digest, stat.st_size)
+        if not hit:
+            # copy outside of the lock, concurrent copies of the same file end up in the same place
+            try:
+                digest = self._copy(path)
+            except OSError as e:
+                logger.warning(f"Cannot stage {path}, the job reads it from its original path: {e}")
+                return None
+            with self._lock:
+                self._known[key] = digest
+                self._pin(digest, stat.st_size)
+                self._evict()
+        return self._link(digest, os.path.basename(path))
+
+    def _link(self, digest: str, name: str) -> str:
+        """
+        Path of the copy under the given file name, hard linking it if it was staged under another name.
+        """
+        directory = os.path.join(self.root, digest)
+        local = os.path.join(directory, name)
+        if not os.path.exists(local):
+            try:
+                os.link(os.path.join(directory, os.listdir(directory)[0]), local)
+            except FileExistsError:
+                pass
+        return local
+
+    def _pin(self, digest: str, size: int):
+        if digest in self._sizes:
+            # move to the most recently used end
+            self._sizes[digest] = self._sizes.pop(digest)
+        else:
+            self._sizes[digest] = size
+            self._total += size
+        self._pins[digest] = self._pins.get(digest, 0) + 1
+
+    def release(self, local: str):
+        digest = os.path.basename(os.path.dirname(local))
+        with self._lock:
+            self._pins[digest] -= 1
+            if not self._pins[digest]:
+                del self._pins[digest]
+            self._evict()
+
+    def _evict(self):
+        for digest in list(self._sizes):
+            if self._total <= self.max_bytes:
+                break
+            if digest in self._pins:
+                continue
+            shutil.rmtree(os.path.join(self.root, digest), ignore_errors=True)
+            self._total -= self._sizes.pop(digest)
+
+    def stage_job(self, job: Job) -> list[str]:
+        """
+        Stage the inputs of a job and point its command and stdin at the local copies, replacing the
+        arguments that are exactly an input path. Inputs that cannot be staged are read from their
+        original path. Returns the local copies, to be released once the job has finished.
+        """
+        staged = []
+        try:
+            for path in job.inputs or []:
+                local = self.stage(path)
+                if local is None:
+                    continue
+                staged.append(local)
+                if isinstance(job.cmd, str):
+                    job.cmd = _replace_word(job.cmd, path, local)
+                else:
+                    job.cmd = [local if arg == path else arg for arg in job.cmd]
+                if job.stdin == path:
+                    job.stdin = local
+        except BaseException:
+            for local in staged:
+                self.release(local)
+            raise
+        return staged
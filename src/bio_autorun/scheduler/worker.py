@@ -1,76 +1,276 @@
+import argparse
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 import logging
+import os
+import socket
 import subprocess
-import sys
+import threading
+from typing import Optional
 
 import requests
 
 from bio_autorun.job import Job, JobStatus
+from bio_autorun.process import JobStreams, wait_with_usage
+from bio_autorun.scheduler.staging import StagingCache
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
-retries = 0
+HEARTBEAT_INTERVAL = 30.0  # seconds, well below the server's lease timeout
+READ_TIMEOUT = 90.0  # seconds, above the server's long-poll timeout
+MAX_DATASETS = 256  # datasets reported to the server as held, most recently used
 
 
-while retries < MAX_RETRIES:
-    try:
-        response = requests.post(f"{sys.argv[1]}/get_job", headers={"X-API-KEY": sys.argv[2]}, timeout=10)
+class Prefetcher:
+    """
+    Lease jobs from the scheduler server in the background, keeping up to ``capacity`` of them buffered
+    so that the next job is ready as soon as one finishes. Each request asks for as many jobs as there
+    are free places in the buffer.
+
+    The same session is used to report results and to keep the leases alive. Lease requests carry the
+    datasets of the jobs run here lately, which the server uses to send us jobs whose data is warm.
+    """
+
+    def __init__(self, uri: str, api_key: str, capacity: int):
+        self.uri = uri
+        self.capacity = capacity
+        self._session = requests.Session()
+        self._session.headers["X-API-KEY"] = api_key
+        self._session.headers["X-WORKER-ID"] = f"{socket.gethostname()}:{os.getpid()}"
+        self._buffer: deque[Job] = deque()
+        self._changed = threading.Condition()
+        self._exhausted = False
+        self._datasets: OrderedDict[str, None] = OrderedDict()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def lease(self, limit: int) -> Optional[list[Job]]:
+        """
+        Lease up to ``limit`` jobs. Returns None if the server had none to give before its long-poll
+        timeout, and an empty list once it has no more jobs at all.
+        """
+        with self._changed:
+            datasets = list(self._datasets)
+        response = self._session.post(f"{self.uri}/get_jobs", params={"max": limit}, json={"datasets": datasets},
+                                      timeout=(10, READ_TIMEOUT))
+        response.raise_for_status()
+        if response.status_code == 204:
+            return None
+        return [Job.from_json(data) for data in response.json()]
+
+    def complete(self, job: Job):
+        if job.inputs:
+            with self._changed:
+                self._datasets[job.inputs[0]] = None
+                self._datasets.move_to_end(job.inputs[0])
+                if len(self._datasets) > MAX_DATASETS:
+                    self._datasets.popitem(last=False)
+        response = self._session.post(f"{self.uri}/complete_job", json=job.to_json(), timeout=10)
+        response.raise_for_status()
+
+    def heartbeat(self, names: list[str]) -> list[str]:
+        """
+        Extend the leases of the given jobs, returning those the server no longer leases to us.
+        """
+        response = self._session.post(f"{self.uri}/heartbeat", json={"jobs": names}, timeout=10)
         response.raise_for_status()
-        job = Job.from_json(response.json())
+        return response.json()["lost"]
 
+    def buffered(self) -> list[str]:
+        with self._changed:
+            return [job.name for job in self._buffer]
+
+    def drop(self, names: set[str]):
+        with self._changed:
+            self._buffer = deque(job for job in self._buffer if job.name not in names)
+            self._changed.notify_all()
+
+    def _run(self):
+        retries = 0
+        while retries < MAX_RETRIES:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self._buffer) < self.capacity)
+                free = self.capacity - len(self._buffer)
+            try:
+                jobs = self.lease(free)
+            except Exception as e:
+                logger.error(f"Error: {e}")
+                retries += 1
+                continue
+            retries = 0
+            if jobs is None:
+                continue
+            if not jobs:
+                break
+            with self._changed:
+                self._buffer.extend(jobs)
+                self._changed.notify_all()
+        with self._changed:
+            self._exhausted = True
+            self._changed.notify_all()
+
+    def get(self) -> Optional[Job]:
+        """
+        Next leased job, or None once the server has no more jobs for us.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._buffer or self._exhausted)
+            if not self._buffer:
+                return None
+            job = self._buffer.popleft()
+            self._changed.notify_all()
+            return job
+
+
+def run_job(job: Job, cache: Optional[StagingCache] = None):
+    cmd, stdin = job.cmd, job.stdin
+    staged = []
+    try:
+        if cache is not None:
+            staged = cache.stage_job(job)
         logger.info(f"Starting job: {job.name} with command: {job.cmd}")
         job.start_time = datetime.now(timezone.utc)
         job.status = JobStatus.STARTED
 
-        if job.stdin:
-            stdin = open(job.stdin, 'r')
-        else:
-            if job.stdin_str:
-                stdin = subprocess.PIPE
-            else:
-                stdin = subprocess.DEVNULL
-        
-        if job.stdout:
-            stdout = open(job.stdout, 'w')
-        else:
-            stdout = subprocess.DEVNULL
-        
-        if job.stderr:
-            if job.stderr == "stdout":
-                stderr = subprocess.STDOUT
-            else:
-                stderr = open(job.stderr, 'w')
-        else:
-            stderr = subprocess.DEVNULL
-
-        # Start the job
-        proc = subprocess.Popen(
-            job.cmd,
-            cwd=job.cwd,
-            env=job.env,
-            shell=job.shell,
-            stdin=stdin,
-            stdout=stdout,
-            stderr=stderr,
-        )
-
-        if job.stdin_str:
-            inp = job.stdin_str.encode('utf-8')
-            proc.communicate(input=inp)
-
-        # Wait for the job to finish
-        proc.wait()
-
-        job.end_time = datetime.now(timezone.utc)
-        job.status = JobStatus.COMPLETED
-        job.exit_code = proc.returncode
-        logger.info(f"Job completed: {job.name} with exit code {job.exit_code}")
-
-        # Reset the retries counter
-        retries = 0
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        retries += 1
-        continue
+        with JobStreams(job) as streams:
+            # Start the job
+            proc = subprocess.Popen(
+                job.cmd,
+                cwd=job.cwd,
+                env=job.env,
+                shell=job.shell,
+                **streams.popen_kwargs,
+            )
+            streams.attach(proc)
+
+            # Wait for the job to finish
+            job.usage = wait_with_usage(proc)
+    finally:
+        for local in staged:
+            cache.release(local)
+        # report the job as it was submitted
+        job.cmd, job.stdin = cmd, stdin
+
+    job.end_time = datetime.now(timezone.utc)
+    job.status = JobStatus.COMPLETED
+    job.exit_code = proc.returncode
+    logger.info(
+        f"Job completed: {job.name} with exit code {job.exit_code}, "
+        f"CPU time {job.usage.cpu_time:.2f}s, max RSS {job.usage.max_rss} KiB"
+    )
+
+
+def _default_slots() -> int:
+    if "SLURM_CPUS_PER_TASK" in os.environ:
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class Slots:
+    """
+    Run jobs concurrently on a fixed number of cores; a job holds as many slots as it has cores.
+    ``on_done`` is called with each job that ran.
+    """
+
+    def __init__(self, count: int, on_done, cache: Optional[StagingCache] = None):
+        self.count = count
+        self.on_done = on_done
+        self.cache = cache
+        self._free = count
+        self._changed = threading.Condition()
+        self._threads: set[threading.Thread] = set()
+        self._running: dict[str, Job] = {}
+
+    def run(self, job: Job):
+        """
+        Start the job in its own thread as soon as enough slots are free.
+        """
+        need = min(max(job.cores, 1), self.count)
+        with self._changed:
+            self._changed.wait_for(lambda: self._free >= need)
+            self._free -= need
+            self._running[job.name] = job
+            thread = threading.Thread(target=self._run, args=(job, need), name=f"job-{job.name}", daemon=True)
+            self._threads.add(thread)
+        thread.start()
+
+    def _run(self, job: Job, need: int):
+        try:
+            run_job(job, self.cache)
+            self.on_done(job)
+        except Exception as e:
+            logger.error(f"Error running job {job.name}: {e}")
+        finally:
+            with self._changed:
+                del self._running[job.name]
+                self._free += need
+                self._threads.discard(threading.current_thread())
+                self._changed.notify_all()
+
+    def running(self) -> list[str]:
+        with self._changed:
+            return list(self._running)
+
+    def join(self):
+        with self._changed:
+            self._changed.wait_for(lambda: not self._threads)
+
+
+def keep_alive(prefetcher: Prefetcher, slots: Slots, stop: threading.Event):
+    """
+    Send heartbeats for the running and buffered jobs until ``stop`` is set.
+    """
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        names = slots.running() + prefetcher.buffered()
+        if not names:
+            continue
+        try:
+            lost = prefetcher.heartbeat(names)
+        except Exception as e:
+            logger.error(f"Error sending heartbeat: {e}")
+            continue
+        if lost:
+            # leases that expired anyway, e.g. after a network outage; the jobs were requeued elsewhere
+            logger.warning(f"Lost the lease of {len(lost)} jobs: {', '.join(lost)}")
+            prefetcher.drop(set(lost))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run jobs from a bio_autorun scheduler server.")
+    parser.add_argument("connect_uri", type=str, help="The URI of the scheduler server.")
+    parser.add_argument("api_key", type=str, help="The API key for authentication.")
+    parser.add_argument("--slots", type=int, default=None,
+                        help="Number of cores to run jobs on (default: SLURM_CPUS_PER_TASK, or the CPUs available "
+                             "to this process).")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="Number of jobs to lease ahead of the running ones (default: the number of slots).")
+    parser.add_argument("--stage-dir", type=str, default=None,
+                        help="Node-local directory to cache the input files of the jobs in (default: no caching).")
+    parser.add_argument("--stage-size", type=float, default=10,
+                        help="Maximum size of the input cache, in GiB.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    cache = StagingCache(args.stage_dir, int(args.stage_size * 1024 ** 3)) if args.stage_dir else None
+    count = args.slots or _default_slots()
+    prefetcher = Prefetcher(args.connect_uri, args.api_key, args.prefetch or count)
+    slots = Slots(count, prefetcher.complete, cache)
+    stop = threading.Event()
+    heartbeats = threading.Thread(target=keep_alive, args=(prefetcher, slots, stop), name="heartbeat", daemon=True)
+    logger.info(f"Running up to {slots.count} jobs at once")
+    prefetcher.start()
+    heartbeats.start()
+    while (job := prefetcher.get()) is not None:
+        slots.run(job)
+    slots.join()
+    stop.set()
+    heartbeats.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import pickle
+import time
+
+from bio_autorun.job import Job, JobStatus
+
+
+def _noop(job):
+    pass
+
+
+def bench_events(args):
+    from bio_autorun.executors.events import EVENT_BUSES, create_event_bus
+
+    statuses = [JobStatus.SUBMITTED, JobStatus.QUEUED, JobStatus.STARTED, JobStatus.COMPLETED]
+    jobs = [Job(name=f"job_{i}", cmd=["true"]) for i in range(args.jobs)]
+    for kind in args.kinds or EVENT_BUSES:
+        bus = create_event_bus(kind, batch_size=args.batch_size)
+        for status in statuses:
+            bus.subscribe(status, _noop)
+        bus.start()
+        begin = time.perf_counter()
+        for job in jobs:
+            for status in statuses:
+                bus.publish(status, job)
+        bus.stop()
+        elapsed = time.perf_counter() - begin
+        events = len(jobs) * len(statuses)
+        print(f"{kind:>8}: {events} events in {elapsed:.3f}s ({events / elapsed:,.0f} events/s)")
+
+
+def _sample_job(i: int) -> Job:
+    now = datetime.now(timezone.utc)
+    return Job(
+        name=f"msa_{i}_cmd_{i % 7}", cmd=["iqtree2", "-s", f"/data/treebase/msa_{i}.phy", "-pre", f"out/msa_{i}", "-seed", str(i)],
+        status=JobStatus.COMPLETED, exit_code=0, submitted_time=now, queued_time=now, start_time=now, end_time=now,
+    )
+
+
+def _measure(label: str, func, jobs: list, size: int):
+    begin = time.perf_counter()
+    for job in jobs:
+        func(job)
+    elapsed = time.perf_counter() - begin
+    print(f"{label:>12}: {elapsed / len(jobs) * 1e6:6.2f} us/job, {size:4d} bytes/job")
+
+
+def bench_codec(args):
+    jobs = [_sample_job(i) for i in range(args.jobs)]
+    encoded = json.dumps(jobs[0].to_json())
+    _measure("json", lambda job: Job.from_json(json.loads(json.dumps(job.to_json()))), jobs, len(encoded))
+    _measure("pickle", lambda job: pickle.loads(pickle.dumps(job)), jobs, len(pickle.dumps(jobs[0])))
+    _measure("binary", lambda job: Job.from_bytes(job.to_bytes()), jobs, len(jobs[0].to_bytes()))
+
+
+def bench_queue(args):
+    import os
+    import tempfile
+    from bio_autorun.scheduler.queues import MemoryQueue, SqliteQueue
+
+    jobs = [_sample_job(i) for i in range(args.jobs)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, queue in (("memory", MemoryQueue()), ("sqlite", SqliteQueue(os.path.join(tmp, "queue.db")))):
+            begin = time.perf_counter()
+            for i in range(0, len(jobs), args.batch_size):
+                queue.put(jobs[i:i + args.batch_size])
+            put = time.perf_counter() - begin
+            begin = time.perf_counter()
+            while taken := queue.take(args.lease_size):
+                queue.ack(job.name for job in taken)
+            take = time.perf_counter() - begin
+            queue.close()
+            print(f"{label:>8}: put {len(jobs) / put:10,.0f} jobs/s, take+ack {len(jobs) / take:10,.0f} jobs/s")
+
+
+def bench_slurm(args):
+    import os
+    import subprocess
+    import tempfile
+    from bio_autorun.executors.slurm import INDEX_WIDTH, CommandList, array_scripts, chunk_commands
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"cmd_{size}")
+            commands = CommandList(path)
+            for i in range(size):
+                commands.write(f"iqtree2 -s /data/treebase/msa_{i}.phy -m GTR+G --prefix out/msa_{i} --seed {i} > /dev/null")
+            commands.close()
+            # the commands themselves are not run, only looked up
+            (indexed,), _ = array_scripts("bench", path, chunk_commands(size), max_array_size=size + 1)
+            indexed = indexed.replace("eval $command", "echo \"$command\"")
+            scanned = f'command=$(sed "${{SLURM_ARRAY_TASK_ID}}q;d" {path})\necho "$command"\n'
+            tasks = sorted({1 + i * (size - 1) // (args.tasks - 1) for i in range(args.tasks)})
+            with open(commands.index_path) as f:
+                offsets = [int(line) for line in f]
+            # sed reads the list up to the command, the index is read at two fixed places
+            read = {
+                "sed": sum(offsets[task] for task in tasks) / len(tasks),
+                "indexed": sum(2 * INDEX_WIDTH + offsets[task] - offsets[task - 1] for task in tasks) / len(tasks),
+            }
+            for label, script in (("sed", scanned), ("indexed", indexed)):
+                begin = time.perf_counter()
+                for task in tasks:
+                    env = {**os.environ, "SLURM_ARRAY_TASK_ID": str(task)}
+                    subprocess.run(["bash", "-c", script], env=env, check=True, stdout=subprocess.DEVNULL)
+                elapsed = (time.perf_counter() - begin) / len(tasks)
+                print(f"{size:>8} tasks {label:>8}: {elapsed * 1e3:7.2f} ms/task start, "
+                      f"{elapsed * size:8.1f}s for the whole array, {read[label] / 1024:10.1f} KiB read/task")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for bio_autorun internals.")
+    subparsers = parser.add_subparsers(required=True)
+
+    events_parser = subparsers.add_parser("events", help="Event bus dispatch throughput.")
+    events_parser.add_argument("--jobs", type=int, default=100000, help="Number of jobs, each emitting 4 events.")
+    events_parser.add_argument("--batch-size", type=int, default=256)
+    events_parser.add_argument("--kinds", nargs="*", help="Event buses to benchmark (default: all).")
+    events_parser.set_defaults(func=bench_events)
+
+    codec_parser = subparsers.add_parser("codec", help="Job serialization round-trip cost.")
+    codec_parser.add_argument("--jobs", type=int, default=100000)
+    codec_parser.set_defaults(func=bench_codec)
+
+    queue_parser = subparsers.add_parser("queue", help="Scheduler queue backend throughput.")
+    queue_parser.add_argument("--jobs", type=int, default=200000)
+    queue_parser.add_argument("--batch-size", type=int, default=1000, help="Jobs per put.")
+    queue_parser.add_argument("--lease-size", type=int, default=8, help="Jobs per take.")
+    queue_parser.set_defaults(func=bench_queue)
+
+    slurm_parser = subparsers.add_parser("slurm", help="Start latency of Slurm array tasks against array size.")
+    slurm_parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000], help="Array sizes.")
+    slurm_parser.add_argument("--tasks", type=int, default=20, help="Tasks started per size, spread over the array.")
+    slurm_parser.add_argument("--dir", type=str, default=None,
+                              help="Directory of the command lists, e.g. on the shared filesystem (default: /tmp).")
+    slurm_parser.set_defaults(func=bench_slurm)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
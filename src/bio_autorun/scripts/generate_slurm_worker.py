@@ -6,6 +6,11 @@ def main():
     parser.add_argument("connect_uri", type=str, help="The URI to connect to the scheduler server.")
     parser.add_argument("api_key", type=str, help="The API key for authentication.")
     parser.add_argument("--sbatch-arg", action="append", default=[], help="Additional sbatch arguments. Can be specified multiple times.")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="Number of jobs each worker leases ahead (default: its number of slots).")
+    parser.add_argument("--stage-dir", type=str, default=None,
+                        help="Node-local directory where workers cache job input files, e.g. '$TMPDIR/autorun'.")
+    parser.add_argument("--stage-size", type=float, default=None, help="Maximum size of the input cache, in GiB.")
     parser.add_argument("-o", "--output", type=argparse.FileType("x"), default="batch.sh")
     args = parser.parse_args()
 
@@ -13,4 +18,16 @@ def main():
     for arg in args.sbatch_arg:
         args.output.write(f"#SBATCH {arg}\n")
     args.output.write("#SBATCH --output=slurm-log/slurm-%A.out\n")
-    args.output.write(f"srun /usr/bin/env python3 -m bio_autorun.scheduler.worker '{args.connect_uri}' '{args.api_key}'\n")
+    # one worker per node, running as many jobs at once as the node has allocated CPUs
+    worker_args = f"'{args.connect_uri}' '{args.api_key}'"
+    if args.prefetch is not None:
+        worker_args += f" --prefetch {args.prefetch}"
+    if args.stage_dir is not None:
+        # double quotes, so that variables such as $TMPDIR expand on the node
+        worker_args += f' --stage-dir "{args.stage_dir}"'
+    if args.stage_size is not None:
+        worker_args += f" --stage-size {args.stage_size}"
+    args.output.write(
+        'srun --ntasks-per-node=1 --cpus-per-task="$SLURM_CPUS_ON_NODE" '
+        f"/usr/bin/env python3 -m bio_autorun.scheduler.worker {worker_args}\n"
+    )
@@ -5,6 +5,8 @@ import os
 
 from bio_autorun.executors.local import LocalExecutor, LocalExecutorConfig
 from bio_autorun.job import Job, JobStatus
+from bio_autorun.msa import MSA
+from bio_autorun.predictor import MakespanReport, RuntimePredictor
 
 
 def import_settings(settings_path):
@@ -32,6 +34,8 @@ def main():
         help="Path to the settings.py file to import"
     )
     parser.add_argument("--log-file", default="iqtree.log", help="Path to the log file")
+    parser.add_argument("--journal", help="Path to a job journal; completed jobs recorded in it are not run again")
+    parser.add_argument("--history-dir", help="Output directory of a previous run, used to submit the longest jobs first")
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO, handlers=[
         logging.FileHandler(args.log_file),
@@ -47,6 +51,7 @@ def main():
     # - COMMANDS: a dictionary where keys and values are the command names and their corresponding command strings
     # - MODELS: a dictionary mapping the data files to the optimal models
     # - ITERS: a dictionary mapping the data files to the number of iterations (optional)
+    # - THREADS: the number of threads of each IQ-TREE run, passed with -nt (optional)
 
     data_names = get_data_file(settings.DATA_DIR)
     logger.info(f"Data files found: {len(data_names)}")
@@ -55,23 +60,55 @@ def main():
             raise RuntimeError(f"Data file {data} not found in models mapping.")
 
     if os.path.exists(settings.OUTPUT_DIR):
-        raise RuntimeError("Output directory already exists.")
-    os.makedirs(settings.OUTPUT_DIR)
+        if not args.journal:
+            raise RuntimeError("Output directory already exists.")
+        logger.info("Output directory already exists, resuming from the journal.")
+    else:
+        os.makedirs(settings.OUTPUT_DIR)
 
-    config = LocalExecutorConfig(max_workers=settings.WORKERS)
+    threads = getattr(settings, "THREADS", None)
+    config = LocalExecutorConfig(max_workers=settings.WORKERS, thread_flag="-nt" if threads else None,
+                                 journal_path=args.journal)
     executor = LocalExecutor(config)
     # executor.event_subscribe(JobStatus.SUBMITTED, lambda job: logging.info(f"Job {job} submitted"))
     executor.event_subscribe(JobStatus.QUEUED, lambda job: logging.info(f"Job {job} queued"))
     executor.event_subscribe(JobStatus.STARTED, lambda job: logging.info(f"Job {job} started at {job.start_time}"))
     executor.event_subscribe(JobStatus.COMPLETED, lambda job: logging.info(f"Job {job} ended at {job.end_time}, exit code: {job.exit_code}"))
 
-    with executor.acquire():
+    predictor = None
+    if args.history_dir:
+        predictor = RuntimePredictor()
+        for command_name in settings.COMMANDS:
+            for seed in settings.SEEDS:
+                for data in data_names:
+                    log_path = os.path.join(args.history_dir, f"{data}_{command_name}_{seed}.log")
+                    if os.path.exists(log_path):
+                        predictor.load_iqtree_log(data, command_name, log_path, threads or 1)
+        logger.info(f"Runtime history loaded for {len(predictor.history)} jobs")
+
+    def build_jobs():
         for command_name, command_str in settings.COMMANDS.items():
             for seed in settings.SEEDS:
                 for data in data_names:
                     job_name = f"{data}_{command_name}_{seed}"
+                    if executor.is_completed(job_name):
+                        continue
                     job_cmd = f"{command_str} -s {os.path.join(settings.DATA_DIR, data)} -m {settings.MODELS[data]} --prefix {os.path.join(settings.OUTPUT_DIR, job_name)} --seed {seed}"
                     if data in settings.ITERS:
                         job_cmd += f" -n {settings.ITERS[data]}"
-                    job = Job(name=job_name, cmd=job_cmd, shell=True)
-                    executor.submit(job)
+                    msa = MSA(data, os.path.join(settings.DATA_DIR, data))
+                    job = Job(name=job_name, cmd=job_cmd, shell=True, cores=threads or 1, inputs=[msa.path])
+                    yield msa, command_name, job
+
+    report = None
+    if predictor is not None:
+        jobs = predictor.longest_first(build_jobs())
+        report = MakespanReport(settings.WORKERS, jobs)
+        report.attach(executor)
+    else:
+        jobs = (job for _, _, job in build_jobs())
+
+    with executor.acquire():
+        executor.submit_many(jobs)
+    if report is not None:
+        logger.info(report)
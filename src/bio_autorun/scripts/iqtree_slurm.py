@@ -3,6 +3,12 @@ import importlib.util
 import logging
 import os
 
+from bio_autorun.executors.slurm import (
+    DEFAULT_TIME_CLASSES, MAX_ARRAY_SIZE, CommandList, write_arrays, write_resubmission
+)
+from bio_autorun.msa import MSA
+from bio_autorun.predictor import RuntimePredictor
+
 
 def import_settings(settings_path):
     spec = importlib.util.spec_from_file_location("settings", settings_path)
@@ -11,6 +17,7 @@ def import_settings(settings_path):
     return settings
 
 logger = logging.getLogger("iqtree")
+MAXTIME_SLACK = 10  # minutes given to IQ-TREE past -maxtime to stop and write its results
 
 
 def get_data_file(data_dir):
@@ -28,11 +35,25 @@ def main():
         default="settings.py",
         help="Path to the settings.py file to import"
     )
-    parser.add_argument("--slurm-output", default="job.sh", help="Path to the slurm output file", type=argparse.FileType("w"))
+    parser.add_argument("--slurm-output", default="job.sh", help="Path to the slurm output file")
     parser.add_argument("--only-skipped", action="store_true", help="Only run skipped data")
-    parser.add_argument("-o", "--output", default="iqtree.cmd", help="Path to the output script", type=argparse.FileType("w"))
+    parser.add_argument("-o", "--output", default="iqtree.cmd", help="Path to the output script")
     parser.add_argument("--log-file", default="iqtree.log", help="Path to the log file")
     parser.add_argument("--skip-data-with-log", action="store_true", help="Skip data files with log files")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Number of commands per array task (default: 1), or at most per task with --chunk-runtime")
+    parser.add_argument("--chunk-runtime", type=float, default=None,
+                        help="Minutes of time limit to pack into each array task; jobs without a time limit run alone")
+    parser.add_argument("--chunk-parallel", action="store_true",
+                        help="Run the commands of an array task in parallel instead of one after the other")
+    parser.add_argument("--max-array-size", type=int, default=MAX_ARRAY_SIZE,
+                        help="MaxArraySize of the cluster, longer arrays are split into several slurm files")
+    parser.add_argument("--history-dir", default=None,
+                        help="Directory of the logs of previous runs, to set the time limit of the jobs without TIME_LIMIT")
+    parser.add_argument("--time-margin", type=float, default=1.5,
+                        help="Time limit of the jobs predicted from --history-dir, relative to the prediction")
+    parser.add_argument("--time-classes", type=float, nargs="+", default=[t / 60 for t in DEFAULT_TIME_CLASSES],
+                        help="Minutes, the time limits of the arrays the jobs are grouped in")
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO, handlers=[
         logging.FileHandler(args.log_file),
@@ -62,7 +83,23 @@ def main():
     else:
         os.makedirs(settings.OUTPUT_DIR)
 
-    number_of_jobs = 0
+    predictor = None
+    if args.history_dir:
+        predictor = RuntimePredictor()
+        for command_name in settings.COMMANDS:
+            for seed in settings.SEEDS:
+                for data in data_names:
+                    log_path = os.path.join(args.history_dir, f"{data}_{command_name}_{seed}.log")
+                    if os.path.exists(log_path):
+                        predictor.load_iqtree_log(data, command_name, log_path)
+        logger.info(f"Runtime history loaded for {len(predictor.history)} jobs")
+        if predictor.history:
+            # unseen data are predicted from their size, at the CPU time per cell of the seen ones
+            predictor.learn_dimensions(MSA(data, os.path.join(settings.DATA_DIR, data)) for data in data_names)
+        else:
+            predictor = None
+
+    commands = CommandList(args.output, "w", estimates=True)
 
     for command_name, command_str in settings.COMMANDS.items():
         for seed in settings.SEEDS:
@@ -86,28 +123,41 @@ def main():
                     job_cmd += f" -n {settings.ITERS[data]}"
                 if data in settings.TIME_LIMIT:
                     job_cmd += f" -maxtime {settings.TIME_LIMIT[data]}"
-                args.output.write(job_cmd + "\n")
-                number_of_jobs += 1
-
-    args.slurm_output.write("#!/bin/bash\n")
-    args.slurm_output.write(f"#SBATCH --hold\n")
-    args.slurm_output.write(f"#SBATCH --job-name={settings.NAME}\n")
-    args.slurm_output.write(f"#SBATCH --ntasks=1\n")
-    args.slurm_output.write(f"#SBATCH --cpus-per-task=1\n")
-    args.slurm_output.write(f"#SBATCH --array=1-{number_of_jobs}\n")
-    args.slurm_output.write(f"#SBATCH --output=slurm-log/slurm-%A_%a.out\n")
-    args.slurm_output.write(f"command=$(sed \"${{SLURM_ARRAY_TASK_ID}}q;d\" {args.output.name})\n")
-    args.slurm_output.write("eval $command\n")
-
-def set_limit():
-    parser = argparse.ArgumentParser(description="Set time limit for iqtree jobs.")
-    parser.add_argument("jobid", help="Job ID to set the time limit for")
-    parser.add_argument("input", nargs='?', default="iqtree.cmd", help="Path to the input script", type=argparse.FileType("r"))
+                limit = None
+                if data in settings.TIME_LIMIT:
+                    limit = (settings.TIME_LIMIT[data] + MAXTIME_SLACK) * 60
+                elif predictor is not None:
+                    runtime = predictor.predict(MSA(data, os.path.join(settings.DATA_DIR, data)), command_name)
+                    limit = runtime * args.time_margin if runtime is not None else None
+                commands.write(job_cmd, limit=limit)
+    commands.close()
+
+    # the time limits are set in the scripts, arrays no longer need an `scontrol update` per task
+    paths = write_arrays(
+        settings.NAME, args.slurm_output, commands, chunk_size=args.chunk_size,
+        chunk_runtime=args.chunk_runtime * 60 if args.chunk_runtime is not None else None,
+        parallel=args.chunk_parallel, time_classes=[t * 60 for t in args.time_classes],
+        max_array_size=args.max_array_size, hold=True, mode="w"
+    )
+    logger.info(f"{commands.count} jobs to submit with: {', '.join(paths)}")
+
 
+def resubmit():
+    parser = argparse.ArgumentParser(
+        description="Write slurm files running again the jobs of slurm_iqtree that did not complete, "
+                    "from the completions recorded by the array tasks."
+    )
+    parser.add_argument("input", nargs="?", default="iqtree.cmd", help="Path to the command list of slurm_iqtree")
+    parser.add_argument("--slurm-output", default="resubmit.sh", help="Path to the slurm output file")
+    parser.add_argument("--job-name", default="resubmit", help="Name of the slurm jobs")
+    parser.add_argument("--hold", action="store_true", help="Submit the jobs held")
+    parser.add_argument("--max-array-size", type=int, default=MAX_ARRAY_SIZE,
+                        help="MaxArraySize of the cluster, longer arrays are split into several slurm files")
     args = parser.parse_args()
-    for i, cmd in enumerate(args.input.readlines()):
-        if "-maxtime" in cmd:
-            limit = int(cmd.split("-maxtime")[1].split()[0])
-            update_cmd = f"sudo scontrol update jobid={args.jobid}_{i+1} TimeLimit={limit+10}"
-            print(update_cmd, flush=True)
-            os.system(update_cmd)
+    logging.basicConfig(level=logging.INFO)
+    paths = write_resubmission(args.job_name, args.slurm_output, args.input, hold=args.hold,
+                               max_array_size=args.max_array_size, mode="w")
+    if paths:
+        logger.info(f"Jobs to submit again with: {', '.join(paths)}")
+    else:
+        logger.info("Every job completed, nothing to submit again.")
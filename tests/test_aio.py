@@ -0,0 +1,29 @@
+import errno
+import os
+
+from bio_autorun.executors import aio
+from bio_autorun.executors.aio import AsyncLocalExecutor, AsyncLocalExecutorConfig
+from bio_autorun.job import Job, JobStatus
+
+
+def _run(jobs):
+    executor = AsyncLocalExecutor(AsyncLocalExecutorConfig(max_workers=2))
+    done = []
+    executor.event_subscribe(JobStatus.COMPLETED, done.append)
+    with executor.acquire():
+        for job in jobs:
+            executor.submit(job)
+    return sorted((job.name, job.exit_code) for job in done)
+
+
+def test_async_local_executor_runs_jobs():
+    jobs = [Job(name=f"j{code}", cmd=f"exit {code}", shell=True) for code in range(3)]
+    assert _run(jobs) == [("j0", 0), ("j1", 1), ("j2", 2)]
+
+
+def test_async_local_executor_waits_without_pidfds(monkeypatch):
+    def pidfd_open(pid):
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+
+    monkeypatch.setattr(aio.os, "pidfd_open", pidfd_open, raising=False)
+    assert _run([Job(name="j", cmd="exit 3", shell=True)]) == [("j", 3)]
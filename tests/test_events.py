@@ -0,0 +1,109 @@
+import asyncio
+import functools
+
+import pytest
+
+from bio_autorun.executors.events import AsyncioEventBus, ProcessEventBus, ThreadEventBus, create_event_bus
+from bio_autorun.job import Job, JobStatus
+
+
+def _jobs(count):
+    return [Job(name=f"j{i}", cmd="true") for i in range(count)]
+
+
+def _append_name(path, job):
+    with open(path, "a") as f:
+        f.write(f"{job.name}\n")
+
+
+class _RecordingBus(ThreadEventBus):
+    def __init__(self, batch_size):
+        super().__init__(batch_size)
+        self.batches = []
+
+    def _dispatch(self, batch):
+        self.batches.append(len(batch))
+        super()._dispatch(batch)
+
+
+@pytest.mark.parametrize("kind", ["thread", "asyncio"])
+def test_event_bus_delivers_in_order_by_status(kind):
+    bus = create_event_bus(kind, batch_size=8)
+    started, completed = [], []
+    bus.subscribe(JobStatus.STARTED, lambda job: started.append(job.name))
+    bus.subscribe(JobStatus.COMPLETED, lambda job: completed.append(job.name))
+    bus.start()
+    jobs = _jobs(100)
+    for job in jobs:
+        bus.publish(JobStatus.STARTED, job)
+        bus.publish(JobStatus.QUEUED, job)
+    for job in jobs:
+        bus.publish(JobStatus.COMPLETED, job)
+    # stop delivers every pending event first
+    bus.stop()
+    assert started == completed == [job.name for job in jobs]
+
+
+@pytest.mark.parametrize("kind", ["thread", "asyncio"])
+def test_event_bus_survives_failing_callbacks(kind):
+    bus = create_event_bus(kind)
+    delivered = []
+
+    def fail(job):
+        raise RuntimeError(job.name)
+
+    bus.subscribe(JobStatus.COMPLETED, fail)
+    bus.subscribe(JobStatus.COMPLETED, lambda job: delivered.append(job.name))
+    bus.start()
+    for job in _jobs(3):
+        bus.publish(JobStatus.COMPLETED, job)
+    bus.stop()
+    assert delivered == ["j0", "j1", "j2"]
+
+
+def test_thread_event_bus_dispatches_in_batches():
+    bus = _RecordingBus(batch_size=4)
+    delivered = []
+    bus.subscribe(JobStatus.COMPLETED, lambda job: delivered.append(job.name))
+    # queued before the dispatcher starts, so it finds them all at once
+    for job in _jobs(10):
+        bus.publish(JobStatus.COMPLETED, job)
+    bus.start()
+    bus.stop()
+    assert bus.batches == [4, 4, 2]
+    assert len(delivered) == 10
+
+
+def test_asyncio_event_bus_awaits_coroutine_callbacks_in_order():
+    bus = AsyncioEventBus(batch_size=2)
+    delivered = []
+
+    async def slow(job):
+        # a later event must not overtake this one
+        await asyncio.sleep(0.001 * (5 - int(job.name[1:])))
+        delivered.append(job.name)
+
+    bus.subscribe(JobStatus.COMPLETED, slow)
+    bus.start()
+    for job in _jobs(5):
+        bus.publish(JobStatus.COMPLETED, job)
+    bus.stop()
+    assert delivered == ["j0", "j1", "j2", "j3", "j4"]
+
+
+def test_process_event_bus_delivers_in_order_before_stopping(tmp_path):
+    path = tmp_path / "events.txt"
+    bus = ProcessEventBus(batch_size=16)
+    bus.subscribe(JobStatus.COMPLETED, functools.partial(_append_name, str(path)))
+    bus.start()
+    jobs = _jobs(50)
+    for job in jobs:
+        bus.publish(JobStatus.STARTED, job)
+        bus.publish(JobStatus.COMPLETED, job)
+    bus.stop()
+    assert path.read_text().split() == [job.name for job in jobs]
+
+
+def test_unknown_event_bus_is_rejected():
+    with pytest.raises(ValueError):
+        create_event_bus("carrier-pigeon")
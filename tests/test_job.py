@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+import marshal
+
+import pytest
+
+from bio_autorun.executors.local import LocalJob
+from bio_autorun.job import Job, JobStatus, ResourceUsage
+
+
+def _full_job():
+    return Job(
+        name="tree", cmd=["iqtree2", "-s", "aln.phy"], env={"OMP_NUM_THREADS": "4"}, cwd="/work", shell=False,
+        stdin="in.txt", stdout="out.txt", stderr="err.txt", stdin_str="y\n", cores=4, memory=2048,
+        runtime_estimate=12.5, time_limit=60.0, cpu_time_limit=240.0, priority=3, queue="expA",
+        inputs=["aln.phy", "model.nex"], status=JobStatus.COMPLETED, exit_code=137,
+        submitted_time=datetime(2024, 5, 1, 12, 0, 0, 1, tzinfo=timezone.utc),
+        queued_time=datetime(2024, 5, 1, 12, 0, 1, tzinfo=timezone.utc),
+        start_time=datetime(2024, 5, 1, 12, 0, 2, 500000, tzinfo=timezone.utc),
+        end_time=datetime(2024, 5, 1, 13, 0, 0, 999999, tzinfo=timezone.utc),
+        usage=ResourceUsage(user_time=3.25, system_time=0.5, max_rss=10240, block_in=8, block_out=16,
+                            voluntary_switches=100, involuntary_switches=7),
+    )
+
+
+def _fields(job):
+    return {name: getattr(job, name) for name in Job.__slots__}
+
+
+def test_bytes_round_trip_keeps_every_field():
+    job = _full_job()
+    decoded = Job.from_bytes(job.to_bytes())
+    assert _fields(decoded) == _fields(job)
+    assert decoded.status is JobStatus.COMPLETED
+    assert decoded.usage.cpu_time == 3.75
+
+
+def test_bytes_round_trip_of_a_bare_job():
+    job = Job(name="echo", cmd="echo hi", shell=True)
+    assert _fields(Job.from_bytes(job.to_bytes())) == _fields(job)
+
+
+def test_bytes_and_json_agree():
+    job = _full_job()
+    assert _fields(Job.from_json(job.to_json())) == _fields(Job.from_bytes(job.to_bytes()))
+
+
+def test_copy_keeps_every_field():
+    job = _full_job()
+    copy = job.copy()
+    assert type(copy) is Job and copy is not job
+    assert _fields(copy) == _fields(job)
+    local = job.copy(LocalJob)
+    assert isinstance(local, LocalJob)
+    assert _fields(local) == _fields(job)
+    assert local.pid is None
+
+
+def test_other_encoding_versions_are_rejected():
+    fields = marshal.loads(_full_job().to_bytes())
+    with pytest.raises(ValueError, match="version 3"):
+        Job.from_bytes(marshal.dumps((3,) + fields[1:]))
+    # older versions had fewer fields
+    with pytest.raises(ValueError, match="version 3"):
+        Job.from_bytes(marshal.dumps((3,) + fields[1:-3]))
@@ -0,0 +1,50 @@
+import sqlite3
+
+from bio_autorun.executors.local import LocalExecutor, LocalExecutorConfig
+from bio_autorun.job import Job, JobStatus
+from bio_autorun.journal import JobJournal
+
+
+def _finished(name, exit_code):
+    job = Job(name=name, cmd="true")
+    job.exit_code = exit_code
+    return job
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = JobJournal(path, batch_size=2)
+    journal.open()
+    for name, exit_code in [("ok", 0), ("failed", 1), ("retried", 1), ("retried", 0)]:
+        job = Job(name=name, cmd="true")
+        journal.record(JobStatus.SUBMITTED, job)
+        journal.record(JobStatus.STARTED, job)
+        journal.record(JobStatus.COMPLETED, _finished(name, exit_code))
+    journal.record(JobStatus.CANCELLED, Job(name="cancelled", cmd="true"))
+    # close writes the records still queued
+    journal.close()
+
+    assert JobJournal(path).completed_jobs() == {"ok", "retried"}
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM events").fetchone() == (13,)
+
+
+def test_executor_resumes_from_its_journal(tmp_path):
+    config = LocalExecutorConfig(cores=1, memory=1024, journal_path=str(tmp_path / "journal.db"))
+    executor = LocalExecutor(config)
+    with executor.acquire():
+        assert not executor.is_completed("ok")
+        executor.submit(Job(name="ok", cmd="true"))
+        executor.submit(Job(name="failed", cmd="false"))
+
+    # a second run, e.g. after a crash, skips the jobs that succeeded
+    executor = LocalExecutor(config)
+    with executor.acquire():
+        assert executor.is_completed("ok")
+        assert not executor.is_completed("failed")
+        assert not executor.is_completed("never-submitted")
+
+
+def test_executor_without_journal_completes_nothing():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024))
+    assert not executor.is_completed("ok")
@@ -0,0 +1,178 @@
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+from bio_autorun.executors.local import LocalExecutor, LocalExecutorConfig
+from bio_autorun.job import Job, JobStatus
+
+
+def _run(config, jobs):
+    """
+    Run jobs to the end, returning the completed and cancelled ones by name.
+    """
+    executor = LocalExecutor(config)
+    done = {}
+    for status in (JobStatus.COMPLETED, JobStatus.CANCELLED):
+        executor.event_subscribe(status, lambda job: done.__setitem__(job.name, job))
+    with executor.acquire():
+        for job in jobs:
+            executor.submit(job)
+    return done
+
+
+def _sleep(name, seconds, cores=1, **kwargs):
+    return Job(name=name, cmd=["sleep", str(seconds)], cores=cores, **kwargs)
+
+
+def test_blocked_job_is_backfilled_around():
+    config = LocalExecutorConfig(cores=2, memory=1024)
+    done = _run(config, [_sleep("small", 0.3), _sleep("wide", 0.1, cores=2), _sleep("backfilled", 0.1)])
+    small, wide, backfilled = done["small"], done["wide"], done["backfilled"]
+    # the wide job waits for both cores, the one behind it uses the free core meanwhile
+    assert backfilled.start_time < small.end_time
+    assert wide.start_time >= small.end_time
+    assert wide.start_time >= backfilled.end_time
+
+
+def test_backfilling_pauses_after_max_backfill():
+    config = LocalExecutorConfig(cores=2, memory=1024, max_backfill=1)
+    jobs = [_sleep("small", 0.3), _sleep("wide", 0.1, cores=2), _sleep("first", 0.1), _sleep("second", 0.1)]
+    done = _run(config, jobs)
+    assert done["first"].start_time < done["small"].end_time
+    # once one job overtook it, the wide job goes next
+    assert done["second"].start_time >= done["wide"].end_time
+
+
+def test_jobs_larger_than_the_node_are_rejected():
+    executor = LocalExecutor(LocalExecutorConfig(cores=2, memory=1024))
+    with executor.acquire():
+        with pytest.raises(ValueError):
+            executor.submit(_sleep("huge", 0, cores=3))
+        with pytest.raises(ValueError):
+            executor.submit(_sleep("hungry", 0, memory=2048))
+
+
+def test_submit_blocks_beyond_max_inflight():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024, max_inflight=2))
+    completed = []
+    executor.event_subscribe(JobStatus.COMPLETED, lambda job: completed.append(job.name))
+    with executor.acquire():
+        executor.submit(_sleep("running", 0.3))
+        executor.submit(_sleep("queued", 0.1))
+        begin = time.monotonic()
+        # waits for the running job to make room
+        executor.submit(_sleep("blocked", 0.1))
+        assert time.monotonic() - begin >= 0.2
+    assert sorted(completed) == ["blocked", "queued", "running"]
+
+
+def test_time_limit_stops_the_job():
+    begin = time.monotonic()
+    done = _run(LocalExecutorConfig(cores=1, memory=1024), [_sleep("slow", 30, time_limit=0.2)])
+    assert time.monotonic() - begin < 5
+    assert done["slow"].status == JobStatus.CANCELLED
+    assert done["slow"].exit_code == -signal.SIGTERM
+
+
+def test_time_limit_escalates_to_sigkill():
+    # SIGTERM is ignored by the shell and by the sleep it starts
+    job = Job(name="stubborn", cmd="trap '' TERM; sleep 30", shell=True, time_limit=0.2)
+    begin = time.monotonic()
+    done = _run(LocalExecutorConfig(cores=1, memory=1024, kill_grace=0.3), [job])
+    assert time.monotonic() - begin < 5
+    assert done["stubborn"].status == JobStatus.CANCELLED
+    assert done["stubborn"].exit_code == -signal.SIGKILL
+
+
+def test_cancel_running_and_queued_jobs():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024))
+    started = threading.Event()
+    executor.event_subscribe(JobStatus.STARTED, lambda job: started.set())
+    cancelled = []
+    executor.event_subscribe(JobStatus.CANCELLED, lambda job: cancelled.append((job.name, job.exit_code)))
+    begin = time.monotonic()
+    with executor.acquire():
+        executor.submit(_sleep("running", 30))
+        executor.submit(_sleep("queued", 30))
+        assert started.wait(5)
+        assert executor.cancel("queued")
+        assert executor.cancel("running")
+        assert not executor.cancel("unknown")
+    assert time.monotonic() - begin < 5
+    # the queued job never ran
+    assert sorted(cancelled) == [("queued", None), ("running", -signal.SIGTERM)]
+
+
+def test_exception_in_acquire_stops_the_jobs():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024))
+    cancelled = []
+    executor.event_subscribe(JobStatus.CANCELLED, lambda job: cancelled.append(job.name))
+    begin = time.monotonic()
+    with pytest.raises(KeyboardInterrupt):
+        with executor.acquire():
+            executor.submit(_sleep("running", 30))
+            executor.submit(_sleep("queued", 30))
+            raise KeyboardInterrupt
+    assert time.monotonic() - begin < 5
+    assert sorted(cancelled) == ["queued", "running"]
+
+
+def test_streams_follow_the_job(tmp_path):
+    (tmp_path / "in.txt").write_text("from a file\n")
+    jobs = [
+        Job(name="file", cmd=["cat"], stdin=str(tmp_path / "in.txt"), stdout=str(tmp_path / "file.out")),
+        Job(name="string", cmd=["cat"], stdin_str="from a string\n", stdout=str(tmp_path / "string.out")),
+        Job(name="merged", cmd="echo out; echo err >&2", shell=True, stdout=str(tmp_path / "merged.out"),
+            stderr="stdout"),
+    ]
+    _run(LocalExecutorConfig(cores=1, memory=1024), jobs)
+    assert (tmp_path / "file.out").read_text() == "from a file\n"
+    assert (tmp_path / "string.out").read_text() == "from a string\n"
+    assert (tmp_path / "merged.out").read_text() == "out\nerr\n"
+
+
+def test_large_stdin_str_does_not_block():
+    data = "x" * (1 << 20)
+    job = Job(name="large", cmd="wc -c", shell=True, stdin_str=data)
+    done = _run(LocalExecutorConfig(cores=1, memory=1024, tail_size=64), [job])
+    assert done["large"].stdout_tail.split() == [str(len(data)).encode()]
+
+
+def test_tails_of_captured_and_redirected_streams(tmp_path):
+    jobs = [
+        Job(name="captured", cmd="printf 0123456789abcdef; printf oops >&2; exit 3", shell=True),
+        Job(name="redirected", cmd="printf 0123456789abcdef", shell=True, stdout=str(tmp_path / "out.txt")),
+    ]
+    done = _run(LocalExecutorConfig(cores=1, memory=1024, tail_size=8), jobs)
+    captured, redirected = done["captured"], done["redirected"]
+    assert captured.exit_code == 3
+    assert (captured.stdout_tail, captured.stderr_tail) == (b"89abcdef", b"oops")
+    # read back from the file, which still gets the whole output
+    assert redirected.stdout_tail == b"89abcdef"
+    assert (tmp_path / "out.txt").read_text() == "0123456789abcdef"
+
+
+def test_tails_are_not_kept_by_default():
+    done = _run(LocalExecutorConfig(cores=1, memory=1024), [Job(name="quiet", cmd="echo hi", shell=True)])
+    assert done["quiet"].stdout_tail is None
+
+
+def test_acquire_keeps_the_exit_code():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024))
+    with pytest.raises(SystemExit) as info:
+        with executor.acquire():
+            sys.exit(0)
+    assert info.value.code == 0
+
+
+def test_cpu_time_limit_is_enforced_by_the_kernel():
+    executor = LocalExecutor(LocalExecutorConfig(cores=1, memory=1024, kill_grace=1))
+    done = []
+    executor.event_subscribe(JobStatus.COMPLETED, done.append)
+    with executor.acquire():
+        executor.submit(Job(name="spin", cmd="while :; do :; done", shell=True, cpu_time_limit=0.5))
+    job, = done
+    assert job.exit_code in (-signal.SIGXCPU, -signal.SIGKILL)
@@ -0,0 +1,128 @@
+from bio_autorun.job import Job
+from bio_autorun.scheduler.queues import FairShare, MemoryQueue, SqliteQueue
+
+
+def _job(name, queue=None, priority=None, dataset=None):
+    return Job(name=name, cmd="true", queue=queue, priority=priority, inputs=[dataset] if dataset else None)
+
+
+def _names(jobs):
+    return [job.name for job in jobs]
+
+
+def test_fair_share_orders_by_priority_then_submission():
+    order = FairShare()
+    for priority in (0, 5, 0, 5):
+        order.push("a", priority, order.next_seq())
+    assert [order.pop() for _ in range(4)] == [("a", 5, 1), ("a", 5, 3), ("a", 0, 0), ("a", 0, 2)]
+    assert len(order) == 0
+
+
+def test_fair_share_serves_queues_by_weight():
+    order = FairShare({"big": 2.0, "small": 1.0})
+    for queue in ("big", "small"):
+        for _ in range(30):
+            order.push(queue, 0, order.next_seq())
+    served = [order.pop()[0] for _ in range(30)]
+    assert served.count("big") == 20
+    assert served.count("small") == 10
+
+
+def test_fair_share_idle_queue_does_not_claim_unused_share():
+    order = FairShare()
+    for _ in range(10):
+        order.push("a", 0, order.next_seq())
+    for _ in range(5):
+        order.pop()
+    for _ in range(5):
+        order.push("b", 0, order.next_seq())
+    served = [order.pop()[0] for _ in range(10)]
+    # b alternates with a instead of running its 5 jobs first
+    assert served == ["b", "a"] * 5
+
+
+def test_fair_share_remove_charges_queue():
+    order = FairShare()
+    seqs = {queue: [order.next_seq() for _ in range(3)] for queue in ("a", "b")}
+    for queue, queue_seqs in seqs.items():
+        for seq in queue_seqs:
+            order.push(queue, 0, seq)
+    order.remove("a", seqs["a"][1])
+    assert len(order) == 5
+    assert order.depths() == {"a": 2, "b": 3}
+    served = [order.pop() for _ in range(5)]
+    assert seqs["a"][1] not in [seq for _, _, seq in served]
+    # a was charged for the removed job, so b is served first
+    assert [queue for queue, _, _ in served] == ["b", "a", "b", "a", "b"]
+
+
+def test_fair_share_restore_refunds_charge():
+    order = FairShare()
+    for queue in ("a", "b"):
+        for _ in range(4):
+            order.push(queue, 0, order.next_seq())
+    # pass over a's first job several times, as locality deferral does
+    for _ in range(3):
+        item = order.pop()
+        assert item[0] == "a"
+        order.restore([item])
+    served = [order.pop()[0] for _ in range(4)]
+    assert served == ["a", "b", "a", "b"]
+
+
+def test_memory_queue_take_ack_nack():
+    queue = MemoryQueue()
+    queue.put([_job(f"j{i}") for i in range(3)])
+    taken = queue.take(2)
+    assert _names(taken) == ["j0", "j1"]
+    assert len(queue) == 1
+    queue.ack(["j0"])
+    queue.nack([taken[1]])
+    # the requeued job keeps its place, ahead of later ones
+    assert _names(queue.take(5)) == ["j1", "j2"]
+    assert queue.take(1) == []
+
+
+def test_memory_queue_nack_of_unknown_job_queues_it_again():
+    queue = MemoryQueue()
+    queue.nack([_job("late")])
+    assert _names(queue.take(1)) == ["late"]
+
+
+def test_memory_queue_prefers_and_defers_datasets():
+    queue = MemoryQueue()
+    queue.put([_job("x0", dataset="x"), _job("y0", dataset="y"), _job("x1", dataset="x")])
+    assert _names(queue.take(1, prefer=["y"])) == ["y0"]
+    assert queue.take(2, defer=lambda dataset, enqueued: dataset == "x") == []
+    assert len(queue) == 2
+    assert _names(queue.take(2)) == ["x0", "x1"]
+
+
+def test_sqlite_queue_survives_reopening(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = SqliteQueue(path)
+    queue.put([_job(f"j{i}", priority=i % 2) for i in range(4)])
+    taken = queue.take(1)
+    assert _names(taken) == ["j1"]
+    queue.ack(["j1"])
+    queue.close()
+
+    queue = SqliteQueue(path)
+    assert len(queue) == 3
+    assert _names(queue.take(3)) == ["j3", "j0", "j2"]
+    queue.close()
+
+
+def test_memory_queue_priority_wins_over_locality():
+    queue = MemoryQueue()
+    queue.put([_job("local0", dataset="a"), _job("local1", dataset="a"), _job("urgent", priority=100, dataset="b")])
+    assert _names(queue.take(1, prefer=["a"])) == ["urgent"]
+    assert _names(queue.take(2, prefer=["a"])) == ["local0", "local1"]
+
+
+def test_memory_queue_fair_share_wins_over_locality():
+    queue = MemoryQueue()
+    queue.put([_job("a0", queue="a", dataset="x"), _job("b0", queue="b", dataset="y"),
+               _job("a1", queue="a", dataset="x"), _job("b1", queue="b", dataset="x")])
+    # x is held, but each queue still gets its turn, and b's turn goes to its job of x
+    assert _names(queue.take(4, prefer=["x"])) == ["a0", "b1", "a1", "b0"]
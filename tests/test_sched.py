@@ -0,0 +1,91 @@
+import time
+
+import pytest
+import requests
+
+from bio_autorun.executors.sched import SchedulerExecutor, SchedulerExecutorConfig
+from bio_autorun.job import Job, JobStatus
+
+
+class _Response:
+    def __init__(self, status):
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+class _Server:
+    """
+    Stands in for the session of the executor, recording what it posts.
+    """
+
+    def __init__(self, add_jobs_status=200):
+        self.add_jobs_status = add_jobs_status
+        self.batches = []
+        self.stopped = False
+        self.closed = False
+
+    def post(self, url, json=None, timeout=None):
+        if url.endswith("/add_jobs"):
+            self.batches.append(json)
+            return _Response(self.add_jobs_status)
+        assert url.endswith("/stop_server")
+        self.stopped = True
+        return _Response(200)
+
+    def close(self):
+        self.closed = True
+
+
+def _executor(server, **kwargs):
+    executor = SchedulerExecutor(SchedulerExecutorConfig("http://scheduler", "key", **kwargs))
+    executor._session = server
+    return executor
+
+
+def test_jobs_are_sent_in_batches():
+    server = _Server()
+    executor = _executor(server, queue="expA", priority=2, batch_size=3, flush_interval=30)
+    submitted = []
+    executor.event_subscribe(JobStatus.SUBMITTED, lambda job: submitted.append(job.name))
+    with executor.acquire():
+        for i in range(7):
+            executor.submit(Job(name=f"j{i}", cmd="true", priority=5 if i == 0 else None))
+    # leaving acquire() sends the last partial batch without waiting for the flush interval
+    assert [len(batch) for batch in server.batches] == [3, 3, 1]
+    jobs = [job for batch in server.batches for job in batch]
+    assert [job["name"] for job in jobs] == [f"j{i}" for i in range(7)]
+    assert {job["queue"] for job in jobs} == {"expA"}
+    assert [job["priority"] for job in jobs[:2]] == [5, 2]
+    assert submitted == [f"j{i}" for i in range(7)]
+    assert server.stopped and server.closed
+
+
+def test_failed_batch_is_raised_and_later_ones_dropped():
+    server = _Server(add_jobs_status=500)
+    executor = _executor(server, flush_interval=0.01)
+    submitted = []
+    executor.event_subscribe(JobStatus.SUBMITTED, lambda job: submitted.append(job.name))
+    with pytest.raises(RuntimeError):
+        with executor.acquire():
+            executor.submit(Job(name="first", cmd="true"))
+            deadline = time.monotonic() + 5
+            while executor._error is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            executor.submit(Job(name="second", cmd="true"))
+    assert len(server.batches) == 1
+    assert submitted == []
+    assert server.closed
+
+
+def test_failed_batch_is_raised_when_leaving_acquire():
+    server = _Server(add_jobs_status=500)
+    executor = _executor(server)
+    with pytest.raises(RuntimeError) as info:
+        with executor.acquire():
+            executor.submit(Job(name="only", cmd="true"))
+    assert isinstance(info.value.__cause__, requests.HTTPError)
+    # the session is closed even though the server was not stopped
+    assert not server.stopped and server.closed
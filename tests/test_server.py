@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from bio_autorun.job import Job
+from bio_autorun.scheduler import server
+from bio_autorun.scheduler.queues import MemoryQueue, SqliteQueue
+from bio_autorun.scheduler.server import Scheduler
+
+
+def _job(name, queue=None, priority=None, dataset=None):
+    return Job(name=name, cmd="true", queue=queue, priority=priority, inputs=[dataset] if dataset else None)
+
+
+def _names(jobs):
+    return [job.name for job in jobs]
+
+
+def test_scheduler_requeues_expired_leases():
+    async def scenario():
+        scheduler = Scheduler(locality_delay=0)
+        await scheduler.start()
+        await scheduler.put([_job("j")])
+        first, = await scheduler.lease("a", 1, 1)
+        scheduler.leases["j"].deadline = 0
+        await scheduler.requeue_expired()
+        assert len(scheduler.queue) == 1
+        second, = await scheduler.lease("b", 1, 1)
+        assert scheduler.heartbeat("a", ["j"]) == ["j"]
+        assert scheduler.heartbeat("b", ["j"]) == []
+
+        # a late result from the former holder wins, and drops b's lease
+        assert await scheduler.complete("a", first)
+        assert scheduler.heartbeat("b", ["j"]) == ["j"]
+        assert not await scheduler.complete("b", second)
+        await scheduler.requeue_expired()
+        assert len(scheduler.queue) == 0
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(server, "MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        scheduler = Scheduler(locality_delay=0)
+        await scheduler.start()
+        await scheduler.put([_job("j")])
+        for worker in ("a", "b"):
+            assert _names(await scheduler.lease(worker, 1, 1)) == ["j"]
+            scheduler.leases["j"].deadline = 0
+            await scheduler.requeue_expired()
+        assert len(scheduler.queue) == 0
+        assert not scheduler.leases
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_scheduler_late_result_drops_requeued_job(tmp_path, persistent):
+    async def scenario():
+        queue = SqliteQueue(str(tmp_path / "queue.db")) if persistent else MemoryQueue()
+        scheduler = Scheduler(queue, locality_delay=0)
+        await scheduler.start()
+        await scheduler.put([_job("j")])
+        job, = await scheduler.lease("a", 1, 1)
+        scheduler.leases["j"].deadline = 0
+        await scheduler.requeue_expired()
+        assert len(scheduler.queue) == 1
+
+        # the result arrives before another worker took the requeued job, which must not run again
+        assert await scheduler.complete("a", job)
+        assert len(scheduler.queue) == 0
+        await scheduler.stop()
+        assert scheduler.drained
+        assert await scheduler.lease("b", 1, 1) == []
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_rejects_malformed_bodies():
+    async def scenario():
+        async with TestClient(TestServer(server.create_app("key"))) as client:
+            for body in (b"not json", b"[]", b"{}", b'{"jobs": "j"}', b'{"jobs": [1]}'):
+                response = await client.post("/heartbeat", data=body, headers={"X-API-KEY": "key"})
+                assert response.status == 400
+            response = await client.post("/heartbeat", json={"jobs": ["j"]}, headers={"X-API-KEY": "key"})
+            assert response.status == 200
+            assert await response.json() == {"lost": ["j"]}
+
+    asyncio.run(scenario())
+
+
+def test_legacy_single_job_leases_never_expire(monkeypatch):
+    monkeypatch.setattr(server, "LEASE_TIMEOUT", 0)
+
+    async def scenario():
+        scheduler = Scheduler(locality_delay=0)
+        await scheduler.start()
+        await scheduler.put([_job("j")])
+        async with TestClient(TestServer(server.create_app("key", scheduler))) as client:
+            response = await client.post("/get_job", headers={"X-API-KEY": "key"})
+            assert (await response.json())["name"] == "j"
+        await asyncio.sleep(0.01)
+        await scheduler.requeue_expired()
+        assert len(scheduler.queue) == 0
+        assert "j" in scheduler.leases
+
+    asyncio.run(scenario())
+
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_endpoint():
+    async def scenario():
+        headers = {"X-API-KEY": "key", "X-WORKER-ID": "w"}
+        async with TestClient(TestServer(server.create_app("key"))) as client:
+            jobs = [_job(f"j{i}", queue="expA").to_json() for i in range(3)]
+            assert (await client.post("/add_jobs", json=jobs, headers=headers)).status == 200
+            leased = await (await client.post("/get_jobs?max=2", headers=headers)).json()
+            for exit_code, data in enumerate(leased):
+                job = Job.from_json(data)
+                job.exit_code = exit_code
+                job.start_time = job.end_time = datetime.now(timezone.utc)
+                assert (await client.post("/complete_job", json=job.to_json(), headers=headers)).status == 200
+
+            # open to scrapers without the API key
+            response = await client.get("/metrics")
+            assert response.status == 200
+            assert response.content_type == "text/plain"
+            text = await response.text()
+
+        assert "# TYPE autorun_job_runtime_seconds histogram" in text
+        samples = _samples(text)
+        assert samples['autorun_jobs_enqueued_total{queue="expA"}'] == 3
+        assert samples['autorun_jobs_dequeued_total{queue="expA"}'] == 2
+        assert samples['autorun_queue_depth{queue="expA"}'] == 1
+        assert samples["autorun_jobs_in_flight"] == 0
+        assert samples["autorun_workers_active"] == 1
+        assert samples['autorun_jobs_completed_total{queue="expA",result="success"}'] == 1
+        assert samples['autorun_jobs_completed_total{queue="expA",result="failure"}'] == 1
+        assert samples['autorun_job_runtime_seconds_count{queue="expA"}'] == 2
+        assert samples['autorun_job_runtime_seconds_bucket{queue="expA",le="0.005"}'] == 2
+        assert samples['autorun_request_duration_seconds_count{endpoint="/complete_job"}'] == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,139 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from bio_autorun.executors.slurm import (
+    INDEX_WIDTH, CommandList, array_scripts, chunk_commands, completed_commands, compress_ranges,
+    count_commands, pack_commands, write_arrays, write_resubmission, _read_commands,
+)
+
+needs_shell = pytest.mark.skipif(shutil.which("bash") is None or shutil.which("dd") is None,
+                                 reason="needs bash and dd")
+
+COMMANDS = ["echo one", "echo 'two words' | tr a-z A-Z", "printf '%s\\n' \"é ü\"", "", "echo last"]
+
+
+def _write_list(path, commands=COMMANDS, **kwargs):
+    commands_list = CommandList(str(path), **kwargs)
+    for command in commands:
+        commands_list.write(command)
+    commands_list.close()
+    return commands_list
+
+
+def _run_array(script_path, tasks, cwd):
+    for task in tasks:
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(task))
+        subprocess.run(["bash", script_path], cwd=cwd, env=env, check=False)
+
+
+def _array_indices(script_path):
+    with open(script_path) as f:
+        return re.search(r"^#SBATCH --array=(\S+)$", f.read(), re.M).group(1)
+
+
+def test_command_list_index_holds_offsets(tmp_path):
+    path = tmp_path / "cmds"
+    _write_list(path)
+    data = path.read_bytes()
+    entries = (tmp_path / "cmds.idx").read_bytes()
+    assert len(entries) == (len(COMMANDS) + 1) * INDEX_WIDTH
+    offsets = [int(entries[i:i + INDEX_WIDTH]) for i in range(0, len(entries), INDEX_WIDTH)]
+    assert offsets[-1] == len(data)
+    for i, command in enumerate(COMMANDS):
+        assert data[offsets[i]:offsets[i + 1]] == f"{command}\n".encode()
+    assert count_commands(str(path)) == len(COMMANDS)
+
+
+@needs_shell
+@pytest.mark.parametrize("first,last", [(1, 1), (2, 2), (4, 4), (5, 5), (1, 5), (2, 4)])
+def test_command_lookup_through_index(tmp_path, first, last):
+    path = tmp_path / "cmds"
+    _write_list(path)
+    seek, read = _read_commands(str(path), str(first), str(last))
+    script = "\n".join(seek + [read])
+    output = subprocess.run(["bash", "-c", script], capture_output=True, check=True).stdout
+    assert output == "".join(f"{command}\n" for command in COMMANDS[first - 1:last]).encode()
+
+
+def test_compress_ranges():
+    assert compress_ranges([]) == ""
+    assert compress_ranges([7]) == "7"
+    assert compress_ranges([9, 1, 2, 3, 4, 5, 12, 13, 14, 20]) == "1-5,9,12-14,20"
+
+
+def test_completed_commands_ignores_partial_lines(tmp_path):
+    path = tmp_path / "cmds"
+    (tmp_path / "cmds.done").write_text("1\n3\n4")
+    assert completed_commands(str(path)) == {1, 3}
+    assert completed_commands(str(tmp_path / "other")) == set()
+
+
+def test_chunk_commands():
+    assert chunk_commands(5, 2) == [(1, 2), (3, 4), (5, 5)]
+    assert chunk_commands(0) == []
+    runtimes = [10, 10, 30, None, 5, 5]
+    assert chunk_commands(6, None, runtimes, 25) == [(1, 2), (3, 3), (4, 4), (5, 6)]
+    assert chunk_commands(6, 1, runtimes, 25) == [(i, i) for i in range(1, 7)]
+
+
+def test_pack_commands_groups_by_time_class():
+    limits = [100, 200, None, 5000, 600, 300]
+    arrays = pack_commands(limits, time_classes=[900, 3600, 4 * 3600], pack_time=900)
+    assert arrays[-1] == (None, [[3]])
+    packed = dict(arrays[:-1])
+    assert packed[4 * 3600] == [[4]]
+    # best fit decreasing: 600 + 300, then 200 + 100
+    assert sorted(sorted(task) for task in packed[900]) == [[1, 2], [5, 6]]
+
+
+def test_pack_commands_respects_chunk_size():
+    arrays = pack_commands([10] * 5, time_classes=[900], pack_time=900, chunk_size=2)
+    (limit, tasks), = arrays
+    assert limit == 900
+    assert sorted(len(task) for task in tasks) == [1, 2, 2]
+
+
+def test_array_scripts_split_long_arrays(tmp_path):
+    scripts, chunk_data = array_scripts("b", str(tmp_path / "cmds"), [(i, i) for i in range(1, 6)],
+                                        max_array_size=3)
+    assert chunk_data is None
+    assert [re.search(r"--array=(\S+)", script).group(1) for script in scripts] == ["1-2", "1-2", "1-1"]
+
+
+@needs_shell
+def test_write_arrays_runs_every_command(tmp_path):
+    commands = CommandList(str(tmp_path / "cmds"), estimates=True)
+    for i in range(1, 8):
+        commands.write(f"echo {i} >> out", limit=[None, 60, 5000][i % 3])
+    commands.close()
+    paths = write_arrays("b", str(tmp_path / "job.sh"), commands, chunk_runtime=900, time_classes=[900, 3600 * 4])
+    for path in paths:
+        last = int(_array_indices(path).rpartition("-")[2])
+        _run_array(path, range(1, last + 1), tmp_path)
+    assert sorted(int(line) for line in (tmp_path / "out").read_text().split()) == list(range(1, 8))
+
+
+@needs_shell
+def test_write_resubmission_runs_only_missing_commands(tmp_path):
+    commands = [f"echo {i} >> out" for i in range(1, 9)]
+    commands[2] = "false"
+    commands_list = _write_list(tmp_path / "cmds", commands)
+    paths = write_arrays("b", str(tmp_path / "job.sh"), commands_list, chunk_size=2)
+    # the task of commands 7 and 8 never ran, e.g. it was preempted
+    _run_array(paths[0], [1, 2, 3], tmp_path)
+    assert completed_commands(str(tmp_path / "cmds")) == {1, 2, 4, 5, 6}
+
+    resubmitted = write_resubmission("r", str(tmp_path / "resubmit.sh"), str(tmp_path / "cmds"))
+    assert resubmitted == [str(tmp_path / "resubmit.sh")]
+    assert _array_indices(resubmitted[0]) == "3,7-8"
+    _run_array(resubmitted[0], [3, 7, 8], tmp_path)
+    assert completed_commands(str(tmp_path / "cmds")) == {1, 2, 4, 5, 6, 7, 8}
+    assert sorted(int(line) for line in (tmp_path / "out").read_text().split()) == [1, 2, 4, 5, 6, 7, 8]
+
+    # only the failing command is left
+    again = write_resubmission("r", str(tmp_path / "again.sh"), str(tmp_path / "cmds"))
+    assert _array_indices(again[0]) == "3"
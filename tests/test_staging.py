@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+from bio_autorun.job import Job
+from bio_autorun.scheduler.staging import StagingCache, _replace_word
+
+
+@pytest.mark.parametrize("cmd, expected", [
+    ("iqtree2 -s /d/aln.phy -nt 2", "iqtree2 -s /l/aln.phy -nt 2"),
+    ("iqtree2 -s '/d/aln.phy'", "iqtree2 -s /l/aln.phy"),
+    ('cat "/d/aln.phy"|wc', "cat /l/aln.phy|wc"),
+    ("cat </d/aln.phy; ls", "cat </l/aln.phy; ls"),
+    # not whole words
+    ("iqtree2 -s /d/aln.phy.gz", "iqtree2 -s /d/aln.phy.gz"),
+    ("cat /x/d/aln.phy", "cat /x/d/aln.phy"),
+    ("cat --in=/d/aln.phy", "cat --in=/d/aln.phy"),
+])
+def test_replace_word(cmd, expected):
+    assert _replace_word(cmd, "/d/aln.phy", "/l/aln.phy") == expected
+
+
+def test_replace_word_quotes_the_local_path():
+    assert _replace_word("cat /d/aln.phy", "/d/aln.phy", "/l/my aln.phy") == "cat '/l/my aln.phy'"
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def _digests(cache):
+    return sorted(name for name in os.listdir(cache.root) if not name.startswith("."))
+
+
+def test_same_content_is_copied_once(tmp_path, monkeypatch):
+    cache = StagingCache(str(tmp_path / "cache"), max_bytes=1000)
+    first = _write(tmp_path / "a" / "aln.phy", b"ACGT")
+    second = _write(tmp_path / "b" / "aln.fasta", b"ACGT")
+    local = cache.stage(first)
+    assert open(local, "rb").read() == b"ACGT"
+    assert os.path.basename(local) == "aln.phy"
+    # same content under another name: a hard link to the same copy
+    other = cache.stage(second)
+    assert os.path.dirname(other) == os.path.dirname(local)
+    assert os.path.basename(other) == "aln.fasta"
+    assert os.stat(other).st_ino == os.stat(local).st_ino
+    assert len(_digests(cache)) == 1
+
+    # an unchanged file is only stat'ed
+    monkeypatch.setattr(cache, "_copy", lambda path: pytest.fail("copied again"))
+    assert cache.stage(first) == local
+
+
+def test_least_recently_used_copies_are_evicted(tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"), max_bytes=10)
+    paths = [_write(tmp_path / f"{name}.phy", name.encode() * 4) for name in "abc"]
+    a = cache.stage(paths[0])
+    cache.release(a)
+    b = cache.stage(paths[1])
+    cache.release(b)
+    # a is used again, b is now the least recently used
+    cache.release(cache.stage(paths[0]))
+    c = cache.stage(paths[2])
+    assert os.path.exists(a) and os.path.exists(c)
+    assert not os.path.exists(b)
+    cache.release(c)
+
+
+def test_pinned_copies_are_not_evicted(tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"), max_bytes=10)
+    a = cache.stage(_write(tmp_path / "a.phy", b"aaaaaa"))
+    # pinned twice, e.g. by two running jobs
+    assert cache.stage(str(tmp_path / "a.phy")) == a
+    b = cache.stage(_write(tmp_path / "b.phy", b"bbbbbb"))
+    # over the budget while both are in use
+    assert os.path.exists(a) and os.path.exists(b)
+    cache.release(a)
+    # a is still used by one job, so b goes although it is the most recently used
+    cache.release(b)
+    assert os.path.exists(a) and not os.path.exists(b)
+    cache.release(a)
+    assert os.path.exists(a)
+
+
+def test_files_that_cannot_be_cached_are_not_staged(tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"), max_bytes=4)
+    assert cache.stage(_write(tmp_path / "big.phy", b"too large")) is None
+    assert cache.stage(str(tmp_path / "missing.phy")) is None
+    assert _digests(cache) == []
+
+
+def test_copies_are_adopted_by_the_next_cache(tmp_path):
+    root = str(tmp_path / "cache")
+    cache = StagingCache(root, max_bytes=10)
+    cache.release(cache.stage(_write(tmp_path / "a.phy", b"aaaaaa")))
+    cache = StagingCache(root, max_bytes=10)
+    # counted against the budget, so the new copy evicts it
+    cache.release(cache.stage(_write(tmp_path / "b.phy", b"bbbbbb")))
+    assert len(_digests(cache)) == 1
+
+
+def test_stage_job_points_the_job_at_the_copies(tmp_path):
+    cache = StagingCache(str(tmp_path / "cache"), max_bytes=1000)
+    aln = _write(tmp_path / "aln.phy", b"ACGT")
+    missing = str(tmp_path / "missing.nex")
+    shell_job = Job(name="s", cmd=f"iqtree2 -s {aln} -p {missing}", shell=True, inputs=[aln, missing])
+    list_job = Job(name="l", cmd=["iqtree2", "-s", aln], stdin=aln, inputs=[aln])
+
+    staged = cache.stage_job(shell_job)
+    local, = staged
+    assert shell_job.cmd == f"iqtree2 -s {local} -p {missing}"
+    assert cache.stage_job(list_job) == [local]
+    assert list_job.cmd == ["iqtree2", "-s", local]
+    assert list_job.stdin == local
+    assert cache._pins == {os.path.basename(os.path.dirname(local)): 2}